@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import signal
+import time
+import requests
+import pymongo
+from pymongo import AsyncMongoClient
+from mongoConf import Config
+from datamall import DATAMALL_URL, get_client
+from datetime import datetime, timezone
+from arrivals import (DATABASE_NAME, ARRIVAL_COLLECTION, ARRIVAL_HISTORY_INDEX, FAVORITES_COLLECTION,
+                      DEFAULT_FAVORITES_USER, TIMESERIES_COLLECTION, BUCKET_COLLECTION, TIMESERIES_OPTIONS,
+                      ARRIVAL_STORAGE_MODES, fetch_bus_arrivals, build_documents_for_storage,
+                      arrival_collection_name, insert_change_entry, log_change_async)
+
+
+class ArrivalDaemon:
+    # Polls a fixed set of bus stops on a fixed cadence and writes each cycle's arrival
+    # documents with one unordered insert_many through the async MongoDB driver.
+    # Requests are spread evenly across the first part of every interval to avoid bursts,
+    # and a cycle that overruns its interval causes the missed ticks to be dropped rather
+    # than queued, so the daemon never falls further and further behind.
+    def __init__(self, bus_stop_codes, collection, datamall_client, interval=30.0, spread=0.8, max_concurrency=8,
+                 storage="flat"):
+        self.bus_stop_codes = list(bus_stop_codes)
+        self.collection = collection
+        self.storage = storage
+        self.datamall_client = datamall_client
+        self.interval = interval
+        self.spread = spread  # Fraction of the interval over which requests are spread
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.stop_event = asyncio.Event()
+        self.cycles = 0
+        self.dropped_cycles = 0
+
+    def stop(self):
+        self.stop_event.set()
+
+    async def poll_stop(self, bus_stop_code, start_at):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(max(0.0, start_at - loop.time()))
+        async with self.semaphore:
+            try:
+                # The pooled client is synchronous, so it runs on a worker thread; it keeps its
+                # connection pool, retries and rate limiting shared with every other caller
+                services = await asyncio.to_thread(fetch_bus_arrivals, self.datamall_client, bus_stop_code)
+            except requests.exceptions.RequestException as e:
+                print(f"Request for bus stop {bus_stop_code} failed: {e}")
+                return None
+        return build_documents_for_storage(self.storage, bus_stop_code, services, datetime.now(timezone.utc))
+
+    async def run_cycle(self, cycle_start):
+        spacing = self.interval * self.spread / max(1, len(self.bus_stop_codes))
+        results = await asyncio.gather(*(
+            self.poll_stop(code, cycle_start + index * spacing) for index, code in enumerate(self.bus_stop_codes)
+        ))
+
+        documents = [document for result in results if result for document in result]
+        inserted = 0
+        if documents:
+            try:
+                if self.storage == "bucketed":
+                    await self.collection.bulk_write(documents, ordered=False)
+                    inserted = len(documents)
+                else:
+                    if self.storage == "flat":
+                        # Logged like nosql.py's inserts, so a savepoint rollback removes them too
+                        await log_change_async(self.collection.database, insert_change_entry(documents))
+                    inserted = len((await self.collection.insert_many(documents, ordered=False)).inserted_ids)
+            except pymongo.errors.BulkWriteError as e:
+                inserted = e.details.get("nInserted", 0) + e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+                print(f"{len(e.details.get('writeErrors', []))} documents failed to insert.")
+        failed = sum(1 for result in results if result is None)
+        return {"stops": len(self.bus_stop_codes), "failed_stops": failed, "documents": inserted}
+
+    async def run(self, max_cycles=0):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while not self.stop_event.is_set() and (max_cycles == 0 or self.cycles < max_cycles):
+            started = time.perf_counter()
+            stats = await self.run_cycle(next_tick)
+            self.cycles += 1
+            elapsed = time.perf_counter() - started
+
+            # Schedule against the fixed cadence; skip any ticks that have already passed
+            next_tick += self.interval
+            now = loop.time()
+            if now > next_tick:
+                missed = int((now - next_tick) // self.interval) + 1
+                self.dropped_cycles += missed
+                next_tick += missed * self.interval
+
+            print(f"Cycle {self.cycles}: {stats['stops']} stops ({stats['failed_stops']} failed), "
+                  f"{stats['documents']} documents in {elapsed:.2f}s, {self.dropped_cycles} cycles dropped")
+            if max_cycles and self.cycles >= max_cycles:
+                break
+            try:
+                await asyncio.wait_for(self.stop_event.wait(), timeout=next_tick - now)
+            except asyncio.TimeoutError:
+                pass
+
+
+async def load_favorite_stops(db, user_id=DEFAULT_FAVORITES_USER):
+    favorites = await db[FAVORITES_COLLECTION].find_one({"_id": user_id})
+    return favorites.get("bus_stops", []) if favorites else []
+
+
+async def main_async(args):
+    mongo_client = AsyncMongoClient(args.mongo_url)
+    db = mongo_client[DATABASE_NAME]
+    try:
+        bus_stop_codes = args.stops.split(",") if args.stops else await load_favorite_stops(db, args.user)
+        if not bus_stop_codes:
+            print("No bus stops to poll. Pass --stops or add favorite bus stops first.")
+            return
+
+        if args.storage == "timeseries" and TIMESERIES_COLLECTION not in await db.list_collection_names():
+            await db.create_collection(TIMESERIES_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+        if args.storage == "flat":
+            await db[ARRIVAL_COLLECTION].create_index(ARRIVAL_HISTORY_INDEX)
+        if args.storage == "bucketed":
+            await db[BUCKET_COLLECTION].create_index([("Date", pymongo.ASCENDING), ("BusStopCode", pymongo.ASCENDING)])
+
+        datamall_client = get_client(args.api_key, args.datamall_url, pool_size=args.concurrency)
+        daemon = ArrivalDaemon(bus_stop_codes, db[arrival_collection_name(args.storage)], datamall_client,
+                               interval=args.interval, max_concurrency=args.concurrency, storage=args.storage)
+
+        # Stop cleanly after the current cycle on Ctrl+C / SIGTERM
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, daemon.stop)
+            except NotImplementedError:
+                pass  # Not supported on Windows; Ctrl+C still ends the process
+
+        print(f"Polling {len(bus_stop_codes)} bus stops every {args.interval}s.")
+        await daemon.run(args.cycles)
+    finally:
+        await mongo_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless bus arrival ingestion service")
+    parser.add_argument("--stops", help="Comma-separated bus stop codes (default: favorite bus stops)")
+    parser.add_argument("--user", default=DEFAULT_FAVORITES_USER, help="User whose favorite bus stops are polled")
+    parser.add_argument("--interval", type=float, default=30.0, help="Seconds between polling cycles")
+    parser.add_argument("--cycles", type=int, default=0, help="Stop after this many cycles (0 runs forever)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--datamall-url", default=DATAMALL_URL, help="Point at a fake DataMall server for testing")
+    parser.add_argument("--api-key", default=Config.LTA_API_KEY)
+    parser.add_argument("--storage", choices=ARRIVAL_STORAGE_MODES, default="flat",
+                        help="Document layout for stored arrivals")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import pymongo
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+# Shared by nosql.py and the arrival daemon: document layout and naming of the arrival store
+DATABASE_NAME = "busArrivals"
+ARRIVAL_COLLECTION = "bus_arrival_data"
+FAVORITES_COLLECTION = "favorite_bus_stops"
+DEFAULT_FAVORITES_USER = "favorites"
+TIMESERIES_COLLECTION = "bus_arrival_timeseries"
+BUCKET_COLLECTION = "bus_arrival_buckets"
+SAVEPOINT_COLLECTION = "bus_arrival_savepoints"
+CHANGE_LOG_COLLECTION = "bus_arrival_changes"
+CHANGE_COUNTER_COLLECTION = "bus_arrival_change_counter"
+CHANGE_COUNTER_ID = "changes"
+
+# How polled arrivals are stored: "flat" writes one display-ready document per service into
+# ARRIVAL_COLLECTION, "timeseries" writes raw measurements into a MongoDB time-series collection
+# and "bucketed" appends compact samples to one document per stop/service/hour
+ARRIVAL_STORAGE_MODES = ("flat", "timeseries", "bucketed")
+
+# DataMall reports arrival times in Singapore time; buckets are keyed by the local date and hour
+SGT = timezone(timedelta(hours=8))
+
+# Layout of one sample in a bucket's "samples" array; ETAs are seconds after poll_ts
+BUCKET_SAMPLE_FIELDS = ("poll_ts", "eta_seconds", "load_code", "type", "feature",
+                        "eta2_seconds", "load2_code", "feature2",
+                        "eta3_seconds", "load3_code", "feature3")
+
+# Serves "history for stop X (and service Y) between t1 and t2" as an index range scan
+ARRIVAL_HISTORY_INDEX = [("BusStopCode", pymongo.ASCENDING), ("ServiceNo", pymongo.ASCENDING),
+                         ("PollTs", pymongo.ASCENDING)]
+
+NEXT_BUS_KEYS = ("NextBus", "NextBus2", "NextBus3")
+NO_ARRIVAL = (None, None)  # (eta_seconds, arrival_ts) when DataMall has no estimate
+
+# Options for creating TIMESERIES_COLLECTION; every poll of a stop/service pair is one measurement
+TIMESERIES_OPTIONS = {
+    "timeField": "poll_time",
+    "metaField": "meta",
+    "granularity": "minutes",
+}
+
+
+# Savepoints cover ARRIVAL_COLLECTION only: every write made to it while a savepoint exists
+# records the inserted ids or the pre-image of the changed document in CHANGE_LOG_COLLECTION.
+# Entries are written before the change itself, so a crash can only leave extra undo steps.
+# nosql.py and the daemon log from different processes, whose ObjectIds are only ordered to the
+# second, so every entry takes a sequence number from one counter document instead; savepoint
+# marks and undo order both use it
+def insert_change_entry(documents):
+    # Ids are assigned up front so the entry can be logged before the documents are inserted
+    for document in documents:
+        document.setdefault("_id", ObjectId())
+    return {"op": "insert", "ids": [document["_id"] for document in documents]}
+
+
+def next_change_seq(db):
+    counter = db[CHANGE_COUNTER_COLLECTION].find_one_and_update(
+        {"_id": CHANGE_COUNTER_ID}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+    return counter["seq"]
+
+
+# Sequence number of the latest logged change (0 before the first one)
+def current_change_seq(db):
+    counter = db[CHANGE_COUNTER_COLLECTION].find_one({"_id": CHANGE_COUNTER_ID})
+    return counter["seq"] if counter else 0
+
+
+def log_change(db, entry):
+    if db[SAVEPOINT_COLLECTION].count_documents({}, limit=1) > 0:
+        entry["seq"] = next_change_seq(db)
+        db[CHANGE_LOG_COLLECTION].insert_one(entry)
+
+
+# Same as log_change, for a database from pymongo's AsyncMongoClient
+async def log_change_async(db, entry):
+    if await db[SAVEPOINT_COLLECTION].count_documents({}, limit=1) > 0:
+        counter = await db[CHANGE_COUNTER_COLLECTION].find_one_and_update(
+            {"_id": CHANGE_COUNTER_ID}, {"$inc": {"seq": 1}}, upsert=True, return_document=ReturnDocument.AFTER)
+        entry["seq"] = counter["seq"]
+        await db[CHANGE_LOG_COLLECTION].insert_one(entry)
+
+
+def get_color(load):
+    if load == "SEA":
+        return "[Green] Seats Available"
+    elif load == "SDA":
+        return "[Amber] Standing Available"
+    elif load == "LSD":
+        return "[Red] Limited Standing"
+    else:
+        return "Unknown"
+
+
+# Display formatting for a stored ETA; arrival times themselves are stored as integer seconds
+def format_eta(eta_seconds):
+    if eta_seconds is None:
+        return None
+    if eta_seconds < 60:
+        return "Arriving"
+    return f"{eta_seconds // 60} mins"
+
+
+# Parses every ETA in a BusArrivalv2 response once, against a single reference clock. Returns one
+# row per service of (eta_seconds, arrival_ts) pairs for NextBus, NextBus2 and NextBus3; repeated
+# timestamps within the response are only parsed the first time they are seen
+def normalize_arrivals(services, reference_ts):
+    parsed = {}
+    timings = []
+    for service in services:
+        row = []
+        for key in NEXT_BUS_KEYS:
+            estimated_arrival = (service.get(key) or {}).get("EstimatedArrival")
+            if not estimated_arrival:
+                row.append(NO_ARRIVAL)
+                continue
+            arrival_ts = parsed.get(estimated_arrival)
+            if arrival_ts is None:
+                arrival_ts = parsed[estimated_arrival] = int(datetime.fromisoformat(estimated_arrival).timestamp())
+            row.append((arrival_ts - reference_ts, arrival_ts))
+        timings.append(row)
+    return timings
+
+
+def create_document(service_no, operation_availability, arrival_availability, estimated_arrival, load, feature,
+                    vehicle_type, next_bus2, next_bus3, timings=None):
+    (eta, arrival_ts), (eta2, arrival_ts2), (eta3, arrival_ts3) = timings or (NO_ARRIVAL,) * 3
+    return {
+        "ServiceNo": service_no,
+        "OperationStatus": operation_availability,
+        "ArrivalStatus": arrival_availability,
+        "EstimatedArrival": estimated_arrival,
+        "EtaSeconds": eta,
+        "ArrivalTs": arrival_ts,
+        "Load": load,
+        "WheelchairAccessible": feature,
+        "VehicleType": vehicle_type,
+        "NextBus2": {
+            "EstimatedArrival": next_bus2.get("EstimatedArrival") if next_bus2 else None,
+            "EtaSeconds": eta2,
+            "ArrivalTs": arrival_ts2,
+            "Load": get_color(next_bus2.get("Load")) if next_bus2 else None,
+            "WheelchairAccessible": next_bus2.get("Feature") if next_bus2 else None
+        },
+        "NextBus3": {
+            "EstimatedArrival": next_bus3.get("EstimatedArrival") if next_bus3 else None,
+            "EtaSeconds": eta3,
+            "ArrivalTs": arrival_ts3,
+            "Load": get_color(next_bus3.get("Load")) if next_bus3 else None,
+            "WheelchairAccessible": next_bus3.get("Feature") if next_bus3 else None
+        },
+    }
+
+
+# Fetches the services arriving at one bus stop from LTA DataMall
+def fetch_bus_arrivals(datamall_client, bus_stop_code, service_no=""):
+    params = {
+        "BusStopCode": bus_stop_code,
+        "ServiceNo": service_no,
+    }
+    return datamall_client.get_json("BusArrivalv2", params).get("Services", [])
+
+
+class InFlightRequest:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.fetched_at = None
+        self.error = None
+
+
+class ArrivalCache:
+    # In-process cache of BusArrivalv2 responses keyed by (BusStopCode, ServiceNo). DataMall only
+    # refreshes arrivals about every 20s, so responses younger than ttl are served from memory.
+    # Concurrent misses for the same key wait for the one request already in flight instead of
+    # calling DataMall themselves, and the least recently used entry is evicted past max_entries.
+    def __init__(self, ttl=20.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (expires_at, services, fetched_at)
+        self.in_flight = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def fetch(self, datamall_client, bus_stop_code, service_no=""):
+        return self.lookup(datamall_client, bus_stop_code, service_no)[0]
+
+    # Returns (services, fetched_at, fresh): fetched_at is when DataMall was actually called and
+    # fresh is True only for the caller that made that call, so each response is stored only once
+    def lookup(self, datamall_client, bus_stop_code, service_no=""):
+        key = (bus_stop_code, service_no)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1], entry[2], False
+            if entry:
+                del self.entries[key]
+                self.expired += 1
+
+            request = self.in_flight.get(key)
+            leader = request is None
+            if leader:
+                request = self.in_flight[key] = InFlightRequest()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            request.done.wait()
+            if request.error:
+                raise request.error
+            return request.result, request.fetched_at, False
+
+        try:
+            request.fetched_at = datetime.now(timezone.utc)
+            request.result = fetch_bus_arrivals(datamall_client, bus_stop_code, service_no)
+        except Exception as e:
+            request.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+                if request.error is None:
+                    self.entries[key] = (time.monotonic() + self.ttl, request.result, request.fetched_at)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > self.max_entries:
+                        self.entries.popitem(last=False)
+                        self.evictions += 1
+            request.done.set()
+        return request.result, request.fetched_at, True
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+# Creates one document per service in a BusArrivalv2 response, tagged with the stop and the poll
+# time (PollTs, epoch seconds). Arrival times are stored as raw ISO strings plus seconds until
+# arrival (relative to poll_time) and absolute epoch seconds
+def build_arrival_documents(bus_stop_code, services, poll_time=None):
+    poll_time = poll_time or datetime.now(timezone.utc)
+    poll_ts = int(poll_time.timestamp())
+    current_date = poll_time.astimezone(SGT).strftime("%Y-%m-%d")
+    timings = normalize_arrivals(services, poll_ts)
+    documents = []
+    for service, service_timings in zip(services, timings):
+        next_bus = service.get("NextBus") or {}
+        bus_arrival_info = create_document(
+            service.get("ServiceNo"),
+            "Bus is in operation" if next_bus.get("EstimatedArrival") else "Bus is NOT in operation",
+            "Arrival data is available" if next_bus.get(
+                "EstimatedArrival") else "Arrival data is NOT available (No Est. Available)",
+            next_bus.get("EstimatedArrival") or None,
+            get_color(next_bus.get("Load")),
+            next_bus.get("Feature"),
+            next_bus.get("Type"),
+            service.get("NextBus2", {}),
+            service.get("NextBus3", {}),
+            service_timings
+        )
+        bus_arrival_info["Date"] = current_date
+        bus_arrival_info["BusStopCode"] = bus_stop_code
+        bus_arrival_info["PollTs"] = poll_ts
+        documents.append(bus_arrival_info)
+    return documents
+
+
+# Creates one time-series measurement per service, keeping DataMall's raw values (ISO arrival
+# times and load/feature codes) so nothing is lost to display formatting
+def build_timeseries_documents(bus_stop_code, services, poll_time):
+    documents = []
+    for service in services:
+        document = {
+            "poll_time": poll_time,
+            "meta": {
+                "BusStopCode": bus_stop_code,
+                "ServiceNo": service.get("ServiceNo"),
+            },
+            "Operator": service.get("Operator"),
+        }
+        for key in ("NextBus", "NextBus2", "NextBus3"):
+            bus = service.get(key) or {}
+            document[key] = {
+                "EstimatedArrival": bus.get("EstimatedArrival") or None,
+                "Load": bus.get("Load") or None,
+                "Feature": bus.get("Feature") or None,
+                "Type": bus.get("Type") or None,
+            }
+        documents.append(document)
+    return documents
+
+
+def bucket_id(bus_stop_code, service_no, poll_time):
+    return f"{bus_stop_code}:{service_no}:{poll_time.astimezone(SGT).strftime('%Y-%m-%dT%H')}"
+
+
+# Creates one $push upsert per service, appending a compact sample to its stop/service/hour bucket
+def build_bucket_updates(bus_stop_code, services, poll_time):
+    poll_ts = int(poll_time.timestamp())
+    local_time = poll_time.astimezone(SGT)
+    timings = normalize_arrivals(services, poll_ts)
+    updates = []
+    for service, ((eta, _), (eta2, _), (eta3, _)) in zip(services, timings):
+        next_bus = service.get("NextBus") or {}
+        next_bus2 = service.get("NextBus2") or {}
+        next_bus3 = service.get("NextBus3") or {}
+        sample = [
+            poll_ts,
+            eta,
+            next_bus.get("Load") or None,
+            next_bus.get("Type") or None,
+            next_bus.get("Feature") or None,
+            eta2,
+            next_bus2.get("Load") or None,
+            next_bus2.get("Feature") or None,
+            eta3,
+            next_bus3.get("Load") or None,
+            next_bus3.get("Feature") or None,
+        ]
+        updates.append(UpdateOne(
+            {"_id": bucket_id(bus_stop_code, service.get("ServiceNo"), poll_time)},
+            {
+                "$push": {"samples": sample},
+                "$inc": {"count": 1},
+                "$setOnInsert": {
+                    "BusStopCode": bus_stop_code,
+                    "ServiceNo": service.get("ServiceNo"),
+                    "Date": local_time.strftime("%Y-%m-%d"),
+                    "Hour": local_time.hour,
+                },
+            },
+            upsert=True,
+        ))
+    return updates
+
+
+# Expands a bucket back into documents shaped like the flat layout, one per stored sample
+def unpack_bucket(bucket):
+    documents = []
+    for index, sample in enumerate(bucket.get("samples", [])):
+        values = dict(zip(BUCKET_SAMPLE_FIELDS, sample))
+        poll_ts = values["poll_ts"]
+
+        etas = (values["eta_seconds"], values["eta2_seconds"], values["eta3_seconds"])
+        timings = [NO_ARRIVAL if eta is None else (eta, poll_ts + eta) for eta in etas]
+        arrival_times = [None if arrival_ts is None else datetime.fromtimestamp(arrival_ts, SGT).isoformat()
+                         for _, arrival_ts in timings]
+
+        document = create_document(
+            bucket["ServiceNo"],
+            "Bus is in operation" if etas[0] is not None else "Bus is NOT in operation",
+            "Arrival data is available" if etas[0] is not None else "Arrival data is NOT available (No Est. Available)",
+            arrival_times[0],
+            get_color(values["load_code"]),
+            values["feature"],
+            values["type"],
+            {"EstimatedArrival": arrival_times[1], "Load": values["load2_code"], "Feature": values["feature2"]},
+            {"EstimatedArrival": arrival_times[2], "Load": values["load3_code"], "Feature": values["feature3"]},
+            timings
+        )
+        document["_id"] = f"{bucket['_id']}:{index}"
+        document["Date"] = bucket["Date"]
+        document["BusStopCode"] = bucket["BusStopCode"]
+        document["PollTime"] = datetime.fromtimestamp(poll_ts, SGT).isoformat()
+        document["PollTs"] = poll_ts
+        documents.append(document)
+    return documents
+
+
+def arrival_collection_name(storage):
+    if storage == "timeseries":
+        return TIMESERIES_COLLECTION
+    if storage == "bucketed":
+        return BUCKET_COLLECTION
+    return ARRIVAL_COLLECTION
+
+
+# Builds the writes for one stop's response in the given storage mode: documents to insert,
+# or UpdateOne operations for the bucketed layout
+def build_documents_for_storage(storage, bus_stop_code, services, poll_time):
+    if storage == "timeseries":
+        return build_timeseries_documents(bus_stop_code, services, poll_time)
+    if storage == "bucketed":
+        return build_bucket_updates(bus_stop_code, services, poll_time)
+    return build_arrival_documents(bus_stop_code, services, poll_time)
@@ -0,0 +1,50 @@
+import argparse
+import pymongo
+from arrivals import DATABASE_NAME, ARRIVAL_COLLECTION, ARRIVAL_HISTORY_INDEX
+
+REDUNDANT_INDEXES = ("BusStopCode_1", "Date_1")
+
+
+# Sets PollTs on documents written before arrival documents carried a poll time. ObjectIds embed
+# the second they were generated, which is when the document was polled and inserted, so the
+# value is derived on the server in a single pipeline update without shipping documents around
+def backfill_poll_ts(collection):
+    result = collection.update_many(
+        {"PollTs": {"$exists": False}},
+        [{"$set": {"PollTs": {"$toLong": {"$floor": {"$divide": [{"$toLong": {"$toDate": "$_id"}}, 1000]}}}}}]
+    )
+    return result.modified_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One-off migration of bus_arrival_data to stop-keyed history")
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.mongo_url)
+    collection = client[DATABASE_NAME][ARRIVAL_COLLECTION]
+    try:
+        updated = backfill_poll_ts(collection)
+        print(f"Backfilled PollTs on {updated} documents.")
+
+        # Built after the backfill so the update does not maintain it document by document
+        collection.create_index(ARRIVAL_HISTORY_INDEX)
+
+        # Single-field indexes left by older versions: BusStopCode_1 is a prefix of the compound
+        # history index and Date_1 a prefix of the (Date, _id) index nosql.py pages by
+        existing = collection.index_information()
+        for name in REDUNDANT_INDEXES:
+            if name in existing:
+                collection.drop_index(name)
+                print(f"Dropped redundant index {name}.")
+
+        # Documents from before stop codes were stored cannot be attributed to a stop
+        unattributed = collection.count_documents({"BusStopCode": {"$exists": False}})
+        if unattributed:
+            print(f"{unattributed} documents have no BusStopCode and will not appear in stop history.")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
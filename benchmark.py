@@ -0,0 +1,165 @@
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from sql import CONNECTION_PROFILES, PublicTransportDatabase, select_specific_bus_stop
+from spatial import StopGrid, haversine
+
+
+def load_dataset(db_file, route_count, stop_count):
+    # Use the rows already stored in the database, or synthesise a dataset of the same
+    # shape as DataMall's (~26k routes over ~5k stops) when it is empty
+    conn = sqlite3.connect(db_file)
+    routes = conn.execute('''
+        SELECT ServiceNo, Operator, Direction, StopSequence, BusStopCode, Distance,
+        WD_FirstBus, WD_LastBus, SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus
+        FROM BusRoutes
+    ''').fetchall()
+    stops = conn.execute("SELECT BusStopCode, RoadName, Description, Latitude, Longitude FROM BusStops").fetchall()
+    services = conn.execute('''
+        SELECT ServiceNo, Operator, Direction, Category, OriginCode, DestinationCode,
+        AM_Peak_Freq, AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq, LoopDesc
+        FROM BusServices
+    ''').fetchall()
+    conn.close()
+
+    rng = random.Random(42)
+    if not stops:
+        stops = [(10000 + i, f"Road {i % 700}", f"Stop {i}", 1.25 + rng.random() * 0.2, 103.6 + rng.random() * 0.4)
+                 for i in range(stop_count)]
+    if not routes:
+        routes = []
+        service = 0
+        while len(routes) < route_count:
+            service += 1
+            for direction in (1, 2):
+                for sequence in range(1, rng.randint(20, 80)):
+                    routes.append((str(service), "SBST", direction, sequence, rng.choice(stops)[0], sequence * 0.6,
+                                   "0530", "2330", "0530", "2330", "0600", "2330"))
+        routes = routes[:route_count]
+    if not services:
+        # Every route needs its service present while foreign keys are enforced
+        services = [(service_no, "SBST", direction, "TRUNK", None, None, "08-12", "10-15", "08-12", "10-15", "")
+                    for service_no, direction in sorted({(route[0], route[2]) for route in routes})]
+    return routes, services, stops
+
+
+def bench_profile(source_db, profile, routes, services, stops, lookups, per_row):
+    # Run every measurement against a fresh copy of the source database
+    work_dir = tempfile.mkdtemp()
+    db_file = os.path.join(work_dir, "bench.db")
+    shutil.copy(source_db, db_file)
+    results = {}
+    try:
+        db = PublicTransportDatabase(db_file, profile=profile)
+        db.create_tables()
+
+        start = time.perf_counter()
+        db.bulk_upsert_stops(stops)
+        db.bulk_upsert_services(services)
+        db.bulk_upsert_routes(routes)
+        results["bulk ingest rows/s"] = (len(stops) + len(services) + len(routes)) / (time.perf_counter() - start)
+
+        # Legacy path: one transaction (and one commit) per row
+        start = time.perf_counter()
+        for route in routes[:per_row]:
+            db.insert_bus_route(*route)
+        results["per-row upsert rows/s"] = per_row / (time.perf_counter() - start)
+
+        rng = random.Random(7)
+        route_keys = [(route[0], route[4]) for route in rng.choices(routes, k=lookups)]
+        stop_codes = [stop[0] for stop in rng.choices(stops, k=lookups)]
+
+        start = time.perf_counter()
+        for service_no, bus_stop_code in route_keys:
+            db.check_bus_route_exists(service_no, bus_stop_code)
+        results["route lookups/s"] = lookups / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for bus_stop_code in stop_codes:
+            select_specific_bus_stop(db, bus_stop_code)
+        results["stop lookups/s"] = lookups / (time.perf_counter() - start)
+        db.close()
+    finally:
+        shutil.rmtree(work_dir)
+    return results
+
+
+def naive_within(stops, lat, lon, radius_m):
+    results = [(haversine(lat, lon, stop[3], stop[4]), stop) for stop in stops]
+    return sorted((result for result in results if result[0] <= radius_m), key=lambda result: result[0])
+
+
+def naive_nearest(stops, lat, lon, k):
+    return sorted(((haversine(lat, lon, stop[3], stop[4]), stop) for stop in stops), key=lambda result: result[0])[:k]
+
+
+def bench_spatial(stops, queries, radius_m, k):
+    # Compare the grid index against a full haversine scan over every stop for the same query points
+    rng = random.Random(11)
+    lats = [stop[3] for stop in stops]
+    lons = [stop[4] for stop in stops]
+    points = [(rng.uniform(min(lats), max(lats)), rng.uniform(min(lons), max(lons))) for _ in range(queries)]
+
+    start = time.perf_counter()
+    grid = StopGrid(stops)
+    results = {"grid build ms": (time.perf_counter() - start) * 1000}
+
+    for name, naive, indexed in (
+        (f"within {radius_m}m", lambda lat, lon: naive_within(stops, lat, lon, radius_m),
+         lambda lat, lon: grid.within(lat, lon, radius_m)),
+        (f"{k} nearest", lambda lat, lon: naive_nearest(stops, lat, lon, k),
+         lambda lat, lon: grid.nearest(lat, lon, k)),
+    ):
+        start = time.perf_counter()
+        expected = [naive(lat, lon) for lat, lon in points]
+        results[f"naive {name} q/s"] = queries / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        actual = [indexed(lat, lon) for lat, lon in points]
+        results[f"grid {name} q/s"] = queries / (time.perf_counter() - start)
+
+        # Both must agree on the distances returned (ties may come back in either order)
+        mismatches = sum(1 for a, b in zip(expected, actual)
+                         if [round(d, 6) for d, _ in a] != [round(d, 6) for d, _ in b])
+        results[f"{name} mismatches"] = mismatches
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SQLite connection profiles for sql.py")
+    parser.add_argument("--db", default="public_transport6.db", help="Source database (copied, never modified)")
+    parser.add_argument("--routes", type=int, default=26000, help="Synthetic routes when the database is empty")
+    parser.add_argument("--stops", type=int, default=5000, help="Synthetic stops when the database is empty")
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--per-row", type=int, default=2000, help="Rows written through insert_bus_route")
+    parser.add_argument("--spatial", action="store_true", help="Benchmark the nearest-stop index instead")
+    parser.add_argument("--queries", type=int, default=2000, help="Spatial queries per measurement")
+    parser.add_argument("--radius", type=int, default=500, help="Radius in metres for within queries")
+    parser.add_argument("--k", type=int, default=5, help="Stops returned by nearest queries")
+    args = parser.parse_args()
+
+    routes, services, stops = load_dataset(args.db, args.routes, args.stops)
+    print(f"Dataset: {len(routes)} routes, {len(services)} services, {len(stops)} stops from {args.db}")
+
+    if args.spatial:
+        for metric, value in bench_spatial(stops, args.queries, args.radius, args.k).items():
+            print(f"{metric:<28}{value:>14,.1f}")
+        return
+
+    table = {}
+    for profile in CONNECTION_PROFILES:
+        table[profile] = bench_profile(args.db, profile, routes, services, stops,
+                                       args.lookups, args.per_row)
+
+    metrics = list(next(iter(table.values())))
+    print(f"{'profile':<14}" + "".join(f"{metric:>24}" for metric in metrics))
+    for profile, results in table.items():
+        print(f"{profile:<14}" + "".join(f"{results[metric]:>24,.0f}" for metric in metrics))
+
+
+if __name__ == "__main__":
+    main()
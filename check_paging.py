@@ -0,0 +1,99 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from datamall import DataMallClient
+from sql import LTADataFetcher, PAGE_SIZE
+
+
+class StubDataMall(ThreadingHTTPServer):
+    # Local stand-in for a DataMall $skip-paged dataset of `total` records numbered 0..total-1.
+    # Every response is delayed by a random amount, so concurrent pages complete out of order.
+    def __init__(self, total, max_delay):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.total = total
+        self.max_delay = max_delay
+        self.requested_skips = []
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        skip = int(parse_qs(url.query).get("$skip", ["0"])[0])
+        with self.server.lock:
+            self.server.requested_skips.append(skip)
+        time.sleep(random.uniform(0, self.server.max_delay))
+
+        records = [{"Id": i} for i in range(skip, min(skip + PAGE_SIZE, self.server.total))]
+        body = json.dumps({"value": records}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Pages a dataset of `total` records from the stub and checks that records come back complete and
+# in $skip order, and that fetching stops at the first short page instead of probing past it
+def check_dataset(total, max_in_flight, max_delay):
+    server = StubDataMall(total, max_delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = DataMallClient("stub", server.base_url, pool_size=max_in_flight, rate_limit=None)
+    try:
+        fetcher = LTADataFetcher("stub", max_in_flight=max_in_flight, client=client)
+        records = fetcher.fetch_all_pages("BusStops")
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    problems = []
+    ids = [record["Id"] for record in records]
+    if ids != list(range(total)):
+        problems.append(f"expected records 0..{total - 1} in order, got {len(ids)} records")
+
+    # The short page is at total // PAGE_SIZE; only the requests already in flight may go past it
+    last_skip = total // PAGE_SIZE * PAGE_SIZE
+    limit = last_skip + (max_in_flight - 1) * PAGE_SIZE
+    beyond = sorted(skip for skip in server.requested_skips if skip > limit)
+    if beyond:
+        problems.append(f"requested pages past the short page at $skip={last_skip}: {beyond}")
+    missing = sorted(set(range(0, last_skip + 1, PAGE_SIZE)) - set(server.requested_skips))
+    if missing:
+        problems.append(f"never requested $skip={missing}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check LTADataFetcher paging against a local stub DataMall server")
+    parser.add_argument("--max-in-flight", type=int, default=4)
+    parser.add_argument("--max-delay", type=float, default=0.05, help="Largest random response delay in seconds")
+    args = parser.parse_args()
+
+    # A short last page, an empty last page (exact multiple), a single short page and an empty dataset
+    totals = [PAGE_SIZE * 5 + 123, PAGE_SIZE * 3, 42, 0]
+    failed = False
+    for total in totals:
+        problems = check_dataset(total, args.max_in_flight, args.max_delay)
+        status = "FAIL" if problems else "ok"
+        print(f"{status}: {total} records with {args.max_in_flight} pages in flight")
+        for problem in problems:
+            print(f"   {problem}")
+        failed = failed or bool(problems)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import shutil
+import tempfile
+from sql import PublicTransportDatabase
+
+# DataMall lists each direction of a service as its own row, so ServiceNo repeats
+SERVICES = [
+    ("10", "SBST", 1, "TRUNK", 75009, 16009, "08-12", "10-15", "08-12", "10-15", ""),
+    ("10", "SBST", 2, "TRUNK", 16009, 75009, "08-12", "10-15", "08-12", "10-15", ""),
+    ("12", "GAS", 1, "TRUNK", 77009, 10499, "07-10", "09-14", "08-11", "10-16", ""),
+    ("12", "GAS", 2, "TRUNK", 10499, 77009, "07-10", "09-14", "08-11", "10-16", ""),
+    ("166", "SMRT", 1, "TRUNK", 59009, 59009, "10-12", "12-15", "10-12", "12-15", "Loop"),
+]
+
+
+def stored_services(db):
+    db.cursor.execute("SELECT * FROM BusServices ORDER BY ServiceNo, Direction")
+    return [tuple(row) for row in db.cursor.fetchall()]
+
+
+# A full refresh must keep every direction of a service, and a later refresh must update the
+# direction that changed without touching the other one
+def check_bulk_upsert(db_file):
+    db = PublicTransportDatabase(db_file, "bulk_load")
+    db.create_tables()
+    problems = []
+    try:
+        db.bulk_upsert_services(SERVICES)
+        if stored_services(db) != sorted(SERVICES):
+            problems.append(f"expected {len(SERVICES)} service rows, got {stored_services(db)}")
+
+        changed = SERVICES[1][:6] + ("06-09",) + SERVICES[1][7:]
+        db.bulk_upsert_services([changed])
+        expected = sorted([SERVICES[0], changed] + SERVICES[2:])
+        if stored_services(db) != expected:
+            problems.append(f"after updating service 10 direction 2, got {stored_services(db)}")
+    finally:
+        db.close()
+    return problems
+
+
+# Incremental sync hashes each direction on its own: an unchanged sync writes nothing, changing
+# one direction rewrites only that row, and dropping one direction deletes only that row
+def check_incremental_sync(db_file):
+    db = PublicTransportDatabase(db_file, "bulk_load")
+    db.create_tables()
+    problems = []
+    try:
+        counts = db.incremental_sync("BusServices", SERVICES)
+        if counts != {"inserted": 5, "changed": 0, "removed": 0, "unchanged": 0}:
+            problems.append(f"first sync: {counts}")
+        if stored_services(db) != sorted(SERVICES):
+            problems.append(f"first sync stored {stored_services(db)}")
+
+        counts = db.incremental_sync("BusServices", SERVICES)
+        if counts != {"inserted": 0, "changed": 0, "removed": 0, "unchanged": 5}:
+            problems.append(f"repeated sync: {counts}")
+
+        changed = SERVICES[1][:6] + ("06-09",) + SERVICES[1][7:]
+        rows = [SERVICES[0], changed, SERVICES[2], SERVICES[4]]  # 12 direction 2 withdrawn
+        counts = db.incremental_sync("BusServices", rows)
+        if counts != {"inserted": 0, "changed": 1, "removed": 1, "unchanged": 3}:
+            problems.append(f"sync with one direction changed and one removed: {counts}")
+        if stored_services(db) != sorted(rows):
+            problems.append(f"after changing and removing a direction, got {stored_services(db)}")
+    finally:
+        db.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check bus service refreshes against a temporary database")
+    parser.parse_args()
+
+    checks = [
+        ("bulk upsert keeps every direction of a service", check_bulk_upsert),
+        ("incremental sync compares each direction of a service", check_incremental_sync),
+    ]
+    work_dir = tempfile.mkdtemp()
+    failed = False
+    try:
+        for index, (name, check) in enumerate(checks):
+            problems = check(os.path.join(work_dir, f"check{index}.db"))
+            status = "FAIL" if problems else "ok"
+            print(f"{status}: {name}")
+            for problem in problems:
+                print(f"   {problem}")
+            failed = failed or bool(problems)
+    finally:
+        shutil.rmtree(work_dir)
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+class Config:
+    API_KEY = "test"
+    DATABASE_NAME = "/tmp/pt_test.db"
@@ -0,0 +1,105 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+DATAMALL_URL = "http://datamall2.mytransport.sg/ltaodataservice"
+
+# Responses worth retrying: rate limited or a transient server-side failure
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity or rate  # Largest burst allowed
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Block until a token is available, then take it
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class DataMallClient:
+    def __init__(self, api_key, base_url=DATAMALL_URL, pool_size=8, rate_limit=10,
+                 max_retries=5, backoff_base=0.5, backoff_cap=30, timeout=30):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate_limit) if rate_limit else None
+
+        # One keep-alive session for every call; headers are set once here instead of per request
+        self.session = requests.Session()
+        self.session.headers.update({
+            "AccountKey": api_key,
+            "accept": "application/json"
+        })
+
+        # pool_block caps the number of open connections per host at pool_size
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def backoff(self, attempt, retry_after=None):
+        # Exponential backoff with full jitter, honouring Retry-After when the server sends one
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        return delay
+
+    def get_json(self, endpoint, params=None):
+        url = f"{self.base_url}/{endpoint}"
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                retry_after = response.headers.get("Retry-After")
+
+            time.sleep(self.backoff(attempt, retry_after))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+# Clients shared across the process, one per API key and base URL, with the settings they were created with
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(api_key, base_url=DATAMALL_URL, **kwargs):
+    # Every caller shares one pool and rate limit, so a caller asking for different settings
+    # (e.g. a larger pool_size) would silently be capped by the first one; refuse that instead
+    with _clients_lock:
+        key = (api_key, base_url)
+        if key not in _clients:
+            _clients[key] = (DataMallClient(api_key, base_url, **kwargs), kwargs)
+        client, settings = _clients[key]
+        if kwargs != settings:
+            raise ValueError(f"DataMall client for {base_url} already exists with settings {settings}, not {kwargs}")
+        return client
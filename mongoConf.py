@@ -0,0 +1,3 @@
+class Config:
+    MONGO_CONNECTION_URL = "mongodb://localhost:27017"
+    LTA_API_KEY = "test"
@@ -1,7 +1,18 @@
 import requests
 import pymongo
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from mongoConf import Config
+from datamall import get_client
+from reports import ensure_report_indexes, print_reports
+from datetime import datetime, timezone
+from pymongo import DeleteMany, ReplaceOne
+from arrivals import (DATABASE_NAME, ARRIVAL_COLLECTION, FAVORITES_COLLECTION, DEFAULT_FAVORITES_USER,
+                      TIMESERIES_COLLECTION, SAVEPOINT_COLLECTION, CHANGE_LOG_COLLECTION,
+                      BUCKET_COLLECTION, TIMESERIES_OPTIONS, format_eta,
+                      build_arrival_documents, build_documents_for_storage, arrival_collection_name,
+                      unpack_bucket, ArrivalCache, ARRIVAL_HISTORY_INDEX, SGT, insert_change_entry, log_change,
+                      current_change_seq)
 
 # Set up MongoDB connection URL
 client = pymongo.MongoClient(Config.MONGO_CONNECTION_URL)
@@ -9,87 +20,176 @@ db = client["busArrivals"]
 collection = db["busArrivalData"]
 favorite_stops_collection = db["favoriteBusStops"]
 
-# Set up LTA API key
-base_url = "http://datamall2.mytransport.sg/ltaodataservice/BusArrivalv2"
-headers = {
-    "AccountKey": Config.LTA_API_KEY,
-    "accept": "application/json",
-}
+# Number of bus stops fetched concurrently by the poller
+POLL_WORKERS = 8
+
+# Set up LTA API client (pooled session shared by every DataMall call)
+datamall_client = get_client(Config.LTA_API_KEY, pool_size=POLL_WORKERS)
+
+# Short-lived cache of arrival responses shared by the interactive lookup and the poller
+arrival_cache = ArrivalCache(ttl=getattr(Config, "ARRIVAL_CACHE_TTL", 20.0),
+                             max_entries=getattr(Config, "ARRIVAL_CACHE_SIZE", 1024))
 
 
 # Connect to the MongoDB database
 client = pymongo.MongoClient("mongodb://localhost:27017")  # Update with your MongoDB connection URL
-db = client["busArrivals"]
-collection = db["bus_arrival_data"]
-favorite_stops_collection = db["favorite_bus_stops"]
+db = client[DATABASE_NAME]
+collection = db[ARRIVAL_COLLECTION]
+favorite_stops_collection = db[FAVORITES_COLLECTION]
 
 # Index for bus_arrival_data collection
-collection.create_index([("BusStopCode", pymongo.ASCENDING)])
-collection.create_index([("Date", pymongo.ASCENDING)])
+collection.create_index(ARRIVAL_HISTORY_INDEX)
+# Serves date lookups and paging within a date; it replaces the single-field Date index
+collection.create_index([("Date", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)])
+
+# Index for bus_arrival_buckets collection
+bucket_collection = db[BUCKET_COLLECTION]
+bucket_collection.create_index([("Date", pymongo.ASCENDING), ("BusStopCode", pymongo.ASCENDING)])
 
 # Index for favorite_bus_stops collection
 favorite_stops_collection.create_index([("bus_stops", pymongo.ASCENDING)])
 
+# Whose favorites this client manages; the default is the id of the original single favorites document
+FAVORITES_USER = getattr(Config, "FAVORITES_USER", DEFAULT_FAVORITES_USER)
+
+# Storage mode for polled arrivals ("flat", "timeseries" or "bucketed"), configurable in mongoConf
+ARRIVAL_STORAGE = getattr(Config, "ARRIVAL_STORAGE", "flat")
+
+# The time-series collection has to be created explicitly before the first insert
+if ARRIVAL_STORAGE == "timeseries" and TIMESERIES_COLLECTION not in db.list_collection_names():
+    db.create_collection(TIMESERIES_COLLECTION, timeseries=TIMESERIES_OPTIONS)
+ensure_report_indexes(db, ARRIVAL_STORAGE)
+
+# Savepoints for bus_arrival_data are persisted as marks into a change log (see arrivals.log_change).
+# Only the flat layout writes there, so time-series and bucketed storage have no savepoints
+savepoint_collection = db[SAVEPOINT_COLLECTION]
+change_log = db[CHANGE_LOG_COLLECTION]
+change_log.create_index([("seq", pymongo.ASCENDING)])
+
 # Global variable to store multiple savepoints
 favorite_stop_savepoints = []
-document_savepoints = []
-
-def get_color(load):
-    if load == "SEA":
-        return "[Green] Seats Available"
-    elif load == "SDA":
-        return "[Amber] Standing Available"
-    elif load == "LSD":
-        return "[Red] Limited Standing"
-    else:
-        return "Unknown"
-
-
-def round_to_minute(time_str):
-    from datetime import datetime, timedelta
-    if time_str:
-        time = datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S+08:00")
-        time_now = datetime.now()
-        time_diff = time - time_now
-        minutes = time_diff.seconds // 60
-        return f"{minutes} mins"
-    return None
-
-
-def create_document(service_no, operation_availability, arrival_availability, estimated_arrival, load, feature,
-                    vehicle_type, next_bus2, next_bus3):
-    return {
-        "ServiceNo": service_no,
-        "OperationStatus": operation_availability,
-        "ArrivalStatus": arrival_availability,
-        "EstimatedArrival": estimated_arrival,
-        "Load": load,
-        "WheelchairAccessible": feature,
-        "VehicleType": vehicle_type,
-        "NextBus2": {
-            "EstimatedArrival": next_bus2.get("EstimatedArrival") if next_bus2 else None,
-            "Load": get_color(next_bus2.get("Load")) if next_bus2 else None,
-            "WheelchairAccessible": next_bus2.get("Feature") if next_bus2 else None
-        },
-        "NextBus3": {
-            "EstimatedArrival": next_bus3.get("EstimatedArrival") if next_bus3 else None,
-            "Load": get_color(next_bus3.get("Load")) if next_bus3 else None,
-            "WheelchairAccessible": next_bus3.get("Feature") if next_bus3 else None
-        },
-    }
 
 def read_all_documents():
     return collection.find()
 
+
+# History browser settings: documents per page, the fields shown for each document and the
+# point past which counting stops (the total is then shown as "N+")
+HISTORY_PAGE_SIZE = 20
+HISTORY_PROJECTION = {
+    "ServiceNo": 1,
+    "BusStopCode": 1,
+    "Date": 1,
+    "EstimatedArrival": 1,
+    "EtaSeconds": 1,
+    "Load": 1,
+    "ArrivalStatus": 1,
+    "PollTs": 1,
+}
+HISTORY_COUNT_LIMIT = 10000
+
+
+# Reads one page of history in _id (insertion) order, continuing after or before the given _id;
+# pages are found with an index range on _id so no earlier documents are skipped over
+def read_history_page(date=None, after_id=None, before_id=None, page_size=HISTORY_PAGE_SIZE):
+    query = {"Date": date} if date else {}
+    direction = pymongo.ASCENDING
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    elif before_id is not None:
+        query["_id"] = {"$lt": before_id}
+        direction = pymongo.DESCENDING
+    cursor = collection.find(query, HISTORY_PROJECTION).sort("_id", direction).limit(page_size).batch_size(page_size)
+    page = list(cursor)
+    if direction == pymongo.DESCENDING:
+        page.reverse()
+    return page
+
+
+# History for one stop (and optionally one service) with PollTs in [start_ts, end_ts); the
+# (BusStopCode, ServiceNo, PollTs) index serves both the range and the sort order
+def read_stop_history(bus_stop_code, start_ts, end_ts, service_no=None):
+    query = {"BusStopCode": bus_stop_code, "PollTs": {"$gte": start_ts, "$lt": end_ts}}
+    if service_no:
+        query["ServiceNo"] = service_no
+    return (collection.find(query, HISTORY_PROJECTION)
+            .sort([("ServiceNo", pymongo.ASCENDING), ("PollTs", pymongo.ASCENDING)])
+            .batch_size(HISTORY_PAGE_SIZE * 5))
+
+
+def count_history(date=None):
+    if date is None:
+        return f"~{collection.estimated_document_count()}"
+    count = collection.count_documents({"Date": date}, limit=HISTORY_COUNT_LIMIT)
+    return f"{count}+" if count == HISTORY_COUNT_LIMIT else str(count)
+
+
+def print_history_document(document):
+    # Documents stored before ETAs were kept in seconds hold the formatted text instead
+    eta = format_eta(document["EtaSeconds"]) if "EtaSeconds" in document else document.get("EstimatedArrival")
+    polled = (datetime.fromtimestamp(document["PollTs"], SGT).strftime("%Y-%m-%d %H:%M:%S")
+              if document.get("PollTs") else document.get("Date"))
+    print(f"{polled}  Stop {document.get('BusStopCode')}  Service {document.get('ServiceNo'):<6} "
+          f"{eta or '-':>8}  {document.get('Load')}  ({document['_id']})")
+
+
+# Pages through the stored arrival history without loading more than one page at a time
+def browse_history(date=None):
+    page = read_history_page(date)
+    if not page:
+        print("No bus arrival documents found.")
+        return
+
+    print(f"Bus Arrival Documents ({count_history(date)} total):")
+    while True:
+        for document in page:
+            print_history_document(document)
+        choice = input("\n[N]ext page, [P]revious page or [Q]uit: ").upper()
+        if choice == "N":
+            next_page = read_history_page(date, after_id=page[-1]["_id"])
+            if next_page:
+                page = next_page
+            else:
+                print("This is the last page.")
+        elif choice == "P":
+            previous_page = read_history_page(date, before_id=page[0]["_id"])
+            if previous_page:
+                page = previous_page
+            else:
+                print("This is the first page.")
+        elif choice == "Q":
+            break
+        else:
+            print("Invalid option. Please enter 'N', 'P' or 'Q'.")
+
+# Returns the flat documents for a date followed by the samples unpacked from that date's buckets
 def read_documents_by_date(current_date):
-    return collection.find({"Date": current_date})
+    documents = list(collection.find({"Date": current_date}))
+    for bucket in bucket_collection.find({"Date": current_date}).sort("_id", pymongo.ASCENDING):
+        documents.extend(unpack_bucket(bucket))
+    return documents
+
+
+def savepoints_active():
+    return savepoint_collection.count_documents({}, limit=1) > 0
+
+
+def insert_documents(documents, ordered=True):
+    log_change(db, insert_change_entry(documents))
+    return collection.insert_many(documents, ordered=ordered)
 
 
 def update_document(document_id, update_data):
+    pre_image = collection.find_one({"_id": document_id})
+    if pre_image:
+        log_change(db, {"op": "update", "pre_image": pre_image})
     collection.update_one({"_id": document_id}, {"$set": update_data})
 
 
 def delete_document(document_id):
+    pre_image = collection.find_one({"_id": document_id})
+    if pre_image:
+        log_change(db, {"op": "delete", "pre_image": pre_image})
     collection.delete_one({"_id": document_id})
 
 
@@ -97,55 +197,60 @@ def find_document_by_date(date):
     return collection.find({"Date": date})
 
 
-# Add favorite bus stop into favorite bus stops list
-def add_favorite_bus_stop():
+# Reads one or more comma-separated 5-digit bus stop codes, re-prompting until all are valid
+def input_bus_stop_codes(prompt):
     while True:
-        bus_stop_code = input("Enter the bus stop code to add to favorites: ")
-        if bus_stop_code.isdigit() and len(bus_stop_code) == 5: # Input validation check
-            break
-        else:
-            print("Invalid bus stop code. Please enter a 5-digit numeric code.")
+        bus_stop_codes = [code.strip() for code in input(prompt).split(",") if code.strip()]
+        if bus_stop_codes and all(code.isdigit() and len(code) == 5 for code in bus_stop_codes): # Input validation check
+            return list(dict.fromkeys(bus_stop_codes))
+        print("Invalid bus stop code. Please enter 5-digit numeric codes separated by commas.")
 
+# Add favorite bus stops into the current user's favorites list
+def add_favorite_bus_stop():
+    bus_stop_codes = input_bus_stop_codes("Enter the bus stop code(s) to add to favorites: ")
     try:
-        favorite_stops = get_favorite_bus_stops()
-        if bus_stop_code not in favorite_stops: # Check if bus stop code input is inside favorites list
-            favorite_stops.append(bus_stop_code)
-            update_favorite_bus_stops(favorite_stops)
-            print(f"Bus stop {bus_stop_code} added to favorites.")
+        if add_favorite_bus_stops(bus_stop_codes):
+            print(f"Bus stop(s) {', '.join(bus_stop_codes)} added to favorites.")
         else:
-            print(f"Bus stop {bus_stop_code} is already in favorites.")
+            print(f"Bus stop(s) {', '.join(bus_stop_codes)} already in favorites.")
     except Exception as e:
         print(f"An error occurred while adding the bus stop: {str(e)}")
 
-# Delete a favorite bus stop from favorites list
+# Delete favorite bus stops from the current user's favorites list
 def delete_favorite_bus_stop():
     while True:
-        bus_stop_code = input("Enter the bus stop code to delete from favorites: ")
-
-        if not bus_stop_code.isdigit() or len(bus_stop_code) != 5: # Input Validation Check
-            print("Invalid bus stop code. Please enter a 5-digit number.")
-        else:
-            favorite_stops = get_favorite_bus_stops() # Gets all bus stop codes from the favorites list
-
-            if bus_stop_code in favorite_stops: # Checks if bus stop code is inside the favorites list
-                favorite_stops.remove(bus_stop_code)
-                update_favorite_bus_stops(favorite_stops)
-                print(f"Bus stop {bus_stop_code} deleted from favorites.")
-            else:
-                print(f"Bus stop {bus_stop_code} is not present in favorites. Please enter a valid bus stop code.")
-                continue  # Continue the loop to prompt the user for input again
-
+        bus_stop_codes = input_bus_stop_codes("Enter the bus stop code(s) to delete from favorites: ")
+        if remove_favorite_bus_stops(bus_stop_codes):
+            print(f"Bus stop(s) {', '.join(bus_stop_codes)} deleted from favorites.")
             break  # Exit the loop if a valid input is provided
+        print("Bus stop(s) not present in favorites. Please enter a valid bus stop code.")
 
-# Gets favorite bus stops from MongoDB Database
-def get_favorite_bus_stops():
-    favorites = favorite_stops_collection.find_one({"_id": "favorites"})
+# Favorites are stored as one document per user, keyed (and indexed) by the user id in _id
+def get_favorite_bus_stops(user_id=None):
+    favorites = favorite_stops_collection.find_one({"_id": user_id or FAVORITES_USER})
     return favorites.get("bus_stops", []) if favorites else []
 
-# Updates favorite bus stops list into MongoDB Database
-def update_favorite_bus_stops(bus_stops):
+# Adds any number of stops in one atomic $addToSet; returns False if all were already favorites
+def add_favorite_bus_stops(bus_stop_codes, user_id=None):
+    result = favorite_stops_collection.update_one(
+        {"_id": user_id or FAVORITES_USER},
+        {"$addToSet": {"bus_stops": {"$each": list(bus_stop_codes)}}},
+        upsert=True
+    )
+    return result.modified_count > 0 or result.upserted_id is not None
+
+# Removes any number of stops in one atomic $pull; returns False if none of them were favorites
+def remove_favorite_bus_stops(bus_stop_codes, user_id=None):
+    result = favorite_stops_collection.update_one(
+        {"_id": user_id or FAVORITES_USER},
+        {"$pull": {"bus_stops": {"$in": list(bus_stop_codes)}}}
+    )
+    return result.modified_count > 0
+
+# Replaces the whole favorites list (used when restoring a savepoint)
+def update_favorite_bus_stops(bus_stops, user_id=None):
     favorite_stops_collection.update_one(
-        {"_id": "favorites"},
+        {"_id": user_id or FAVORITES_USER},
         {"$set": {"bus_stops": bus_stops}},
         upsert=True
     )
@@ -169,60 +274,126 @@ def get_bus_arrival_info():
             print("Invalid Bus Stop Code. It must be a 5-digit number. Please try again.")
 
     service_no = input("Enter Service Number (press Enter to skip): ")
-    params = {
-        "BusStopCode": bus_stop_code,
-        "ServiceNo": service_no,
+    # Makes the HTTP GET request to the LTA API, retrying transient failures
+    try:
+        services, _, fresh = arrival_cache.lookup(datamall_client, bus_stop_code, service_no)
+    except requests.exceptions.RequestException as e:
+        print(f"Request failed: {e}")
+        return
+
+    # Creates the documents to store all Bus Arrival Info and inserts them into the MongoDB Database.
+    # A response served from the cache was stored by whoever fetched it, so it is only displayed
+    documents = build_arrival_documents(bus_stop_code, services)
+    if documents and fresh:
+        insert_documents(documents)
+
+    for bus_arrival_info in documents:
+        # Print Statements for Bus Arrival
+        print(f"Service Number: {bus_arrival_info['ServiceNo']}")
+        print(f"Operation Status: {bus_arrival_info['OperationStatus']}")
+        print(f"Arrival Status: {bus_arrival_info['ArrivalStatus']}")
+
+        print("\nArriving Bus:")
+        print(f"   - Arriving In: {format_eta(bus_arrival_info['EtaSeconds'])}")
+        print(f"   - Load: {bus_arrival_info['Load']}")
+        print(f"   - Wheelchair Accessible: {bus_arrival_info['WheelchairAccessible']}")
+
+        print("\nNext Bus 2:")
+        print(f"   - Arriving In: {format_eta(bus_arrival_info['NextBus2']['EtaSeconds'])}")
+        print(f"   - Load: {bus_arrival_info['NextBus2']['Load']}")
+        print(f"   - Wheelchair Accessible: {bus_arrival_info['NextBus2']['WheelchairAccessible']}")
+
+        print("\nNext Bus 3:")
+        print(f"   - Arriving In: {format_eta(bus_arrival_info['NextBus3']['EtaSeconds'])}")
+        print(f"   - Load: {bus_arrival_info['NextBus3']['Load']}")
+        print(f"   - Wheelchair Accessible: {bus_arrival_info['NextBus3']['WheelchairAccessible']}")
+
+        if fresh:
+            print(f"\nDocument inserted with ID: {bus_arrival_info['_id']}\n")
+        else:
+            print("\nServed from the arrival cache; already stored.\n")
+
+
+# Fetches arrivals for many bus stops concurrently and writes every resulting document
+# with a single unordered insert_many, returning the cycle's latency and throughput.
+# Responses served from the arrival cache were already stored when they were fetched, so they
+# are skipped rather than stored again as new observations
+def poll_bus_stops(bus_stop_codes, max_workers=POLL_WORKERS, storage=ARRIVAL_STORAGE):
+    start = time.perf_counter()
+    documents = []
+    failed_stops = []
+    cached_stops = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(arrival_cache.lookup, datamall_client, code): code for code in bus_stop_codes}
+        for future in as_completed(futures):
+            bus_stop_code = futures[future]
+            try:
+                services, fetched_at, fresh = future.result()
+            except requests.exceptions.RequestException as e:
+                print(f"Request for bus stop {bus_stop_code} failed: {e}")
+                failed_stops.append(bus_stop_code)
+                continue
+            if not fresh:
+                cached_stops += 1
+                continue
+            documents.extend(build_documents_for_storage(storage, bus_stop_code, services, fetched_at))
+    fetch_seconds = time.perf_counter() - start
+
+    inserted = 0
+    if documents:
+        target = db[arrival_collection_name(storage)]
+        try:
+            if storage == "bucketed":
+                # Every update appends one sample, either to an existing bucket or a new one
+                target.bulk_write(documents, ordered=False)
+                inserted = len(documents)
+            elif storage == "flat":
+                inserted = len(insert_documents(documents, ordered=False).inserted_ids)
+            else:
+                inserted = len(target.insert_many(documents, ordered=False).inserted_ids)
+        except pymongo.errors.BulkWriteError as e:
+            # Unordered writes keep going past failures; count what made it in
+            inserted = e.details.get("nInserted", 0) + e.details.get("nUpserted", 0) + e.details.get("nModified", 0)
+            print(f"{len(e.details.get('writeErrors', []))} documents failed to insert.")
+
+    cycle_seconds = time.perf_counter() - start
+    return {
+        "stops": len(bus_stop_codes),
+        "failed_stops": len(failed_stops),
+        "cached_stops": cached_stops,
+        "documents": inserted,
+        "fetch_seconds": fetch_seconds,
+        "cycle_seconds": cycle_seconds,
+        "docs_per_second": inserted / cycle_seconds if cycle_seconds > 0 else 0.0,
     }
-    # Makes the HTTP GET request to the LTA API
-    response = requests.get(base_url, headers=headers, params=params)
-
-    if response.status_code == 200:
-        data = response.json()
-        services = data.get("Services", [])
-
-        for service in services:
-            current_date = datetime.now().strftime("%Y-%m-%d")
-            # Creates a document to store all Bus Arrival Info
-            bus_arrival_info = create_document(
-                service.get("ServiceNo"),
-                "Bus is in operation" if service.get("NextBus", {}).get(
-                    "EstimatedArrival") else "Bus is NOT in operation",
-                "Arrival data is available" if service.get("NextBus", {}).get(
-                    "EstimatedArrival") else "Arrival data is NOT available (No Est. Available)",
-                round_to_minute(service.get("NextBus", {}).get("EstimatedArrival")),
-                get_color(service.get("NextBus", {}).get("Load")),
-                service.get("NextBus", {}).get("Feature"),
-                service.get("NextBus", {}).get("Type"),
-                service.get("NextBus2", {}),
-                service.get("NextBus3", {})
-            )
-            bus_arrival_info["Date"] = current_date
-            # Inserts the document into the MongoDB Database
-            document_id = collection.insert_one(bus_arrival_info).inserted_id
-
-            # Print Statements for Bus Arrival
-            print(f"Service Number: {service.get('ServiceNo')}")
-            print(f"Operation Status: {bus_arrival_info['OperationStatus']}")
-            print(f"Arrival Status: {bus_arrival_info['ArrivalStatus']}")
-
-            print("\nArriving Bus:")
-            print(f"   - Arriving In: {bus_arrival_info['EstimatedArrival']}")
-            print(f"   - Load: {bus_arrival_info['Load']}")
-            print(f"   - Wheelchair Accessible: {bus_arrival_info['WheelchairAccessible']}")
-
-            print("\nNext Bus 2:")
-            print(f"   - Arriving In: {round_to_minute(bus_arrival_info['NextBus2']['EstimatedArrival'])}")
-            print(f"   - Load: {bus_arrival_info['NextBus2']['Load']}")
-            print(f"   - Wheelchair Accessible: {bus_arrival_info['NextBus2']['WheelchairAccessible']}")
-
-            print("\nNext Bus 3:")
-            print(f"   - Arriving In: {round_to_minute(bus_arrival_info['NextBus3']['EstimatedArrival'])}")
-            print(f"   - Load: {bus_arrival_info['NextBus3']['Load']}")
-            print(f"   - Wheelchair Accessible: {bus_arrival_info['NextBus3']['WheelchairAccessible']}")
-
-            print(f"\nDocument inserted with ID: {document_id}\n")
-    else:
-        print(f"Request failed with status code {response.status_code}")
+
+
+# Polls every favorite bus stop on a fixed interval until the cycle count is reached or Ctrl+C
+def poll_favorite_bus_stops():
+    try:
+        interval = float(input("Enter polling interval in seconds (default 30): ") or 30)
+        cycles = int(input("Enter number of cycles (0 to poll until Ctrl+C): ") or 0)
+    except ValueError:
+        print("Invalid input. Please enter numbers only.")
+        return
+
+    bus_stop_codes = get_favorite_bus_stops()
+    if not bus_stop_codes:
+        print("No favorite bus stops to poll.")
+        return
+
+    cycle = 0
+    try:
+        while cycles == 0 or cycle < cycles:
+            cycle += 1
+            stats = poll_bus_stops(bus_stop_codes)
+            print(f"Cycle {cycle}: {stats['stops']} stops ({stats['failed_stops']} failed, {stats['cached_stops']} cached), "
+                  f"{stats['documents']} documents in {stats['cycle_seconds']:.2f}s "
+                  f"(fetch {stats['fetch_seconds']:.2f}s, {stats['docs_per_second']:.0f} docs/sec)")
+            if cycles == 0 or cycle < cycles:
+                time.sleep(max(0.0, interval - stats["cycle_seconds"]))
+    except KeyboardInterrupt:
+        print("\nPolling stopped.")
 
 
 def create_savepoint():
@@ -253,25 +424,48 @@ def rollback_to_savepoint():
             print(f"An error occurred during the rollback: {str(e)}")
 
 
+# Creating a savepoint only records the sequence number of the latest logged change
 def create_savepoint_for_documents():
-    global document_savepoints
-    documents = list(read_all_documents())
-    document_savepoints.append(documents.copy())
-    print(f"Document Savepoint {len(document_savepoints)} created.")
+    if ARRIVAL_STORAGE != "flat":
+        print(f"Savepoints only cover flat storage; arrivals are stored as {ARRIVAL_STORAGE}.")
+        return
+    if not savepoints_active():
+        change_log.delete_many({})  # Entries left over from earlier sessions belong to no savepoint
+    savepoint_number = savepoint_collection.count_documents({}) + 1
+    savepoint_collection.insert_one({
+        "_id": savepoint_number,
+        "mark": current_change_seq(db),
+        "created": datetime.now(timezone.utc),
+    })
+    print(f"Document Savepoint {savepoint_number} created.")
+
+
+# Undoes every logged change made after the mark, newest first, in one ordered bulk write
+def undo_changes_since(mark):
+    query = {"seq": {"$gt": mark}}
+    operations = []
+    for entry in change_log.find(query).sort("seq", pymongo.DESCENDING):
+        if entry["op"] == "insert":
+            operations.append(DeleteMany({"_id": {"$in": entry["ids"]}}))
+        else:
+            pre_image = entry["pre_image"]
+            operations.append(ReplaceOne({"_id": pre_image["_id"]}, pre_image, upsert=True))
+    if operations:
+        collection.bulk_write(operations, ordered=True)
+    change_log.delete_many(query)
+    return len(operations)
+
 
 def rollback_documents_to_savepoint():
-    global document_savepoints
     while True:
         try:
             rollback_number = int(input("Enter the rollback number: "))
-            if 1 <= rollback_number <= len(document_savepoints):
-                document_savepoints = document_savepoints[:rollback_number]
-                new_documents = document_savepoints[rollback_number - 1]
-                # Clear the current documents and insert the documents from the savepoint
-                collection.delete_many({})
-                if new_documents:
-                    collection.insert_many(new_documents)
-                print(f"Bus arrival documents rolled back to Savepoint {rollback_number}.")
+            savepoint = savepoint_collection.find_one({"_id": rollback_number})
+            if savepoint:
+                undone = undo_changes_since(savepoint["mark"])
+                # Clear savepoints that occurred after the specified rollback point
+                savepoint_collection.delete_many({"_id": {"$gt": rollback_number}})
+                print(f"Bus arrival documents rolled back to Savepoint {rollback_number} ({undone} changes undone).")
                 break  # Exit the loop if the input is valid
             else:
                 print("Invalid rollback number for bus arrival documents.")
@@ -289,29 +483,24 @@ try:
         print("3. Add Favorite Bus Stop")
         print("4. Delete Favorite Bus Stop")
         print("5. Display Favorite Bus Stops")
-        print("6. Create Savepoint for Bus Arrival Documents")
-        print("7. Rollback to Savepoint for Bus Arrival Documents")
+        print("6. Create Savepoint for Bus Arrival Documents (flat storage only)")
+        print("7. Rollback to Savepoint for Bus Arrival Documents (flat storage only)")
         print("8. Create Savepoint for Favorite Bus Stops")
         print("9. Rollback to Savepoint for Favorite Bus Stops")
+        print("10. Poll Favorite Bus Stops")
         print("0. Exit")
 
-        choice = input("Enter your choice (0-9): ")
+        choice = input("Enter your choice (0-10): ")
 
         if choice == "1":
             get_bus_arrival_info()
 
         elif choice == "2":
-            view_option = input("Enter 'A' to view all documents or 'D' to view by date: ").upper()
+            view_option = input("Enter 'A' to view all documents, 'D' to view by date, 'S' for a bus stop's "
+                                "history or 'R' for reports: ").upper()
             if view_option == "A":
-                # Display all documents
-                documents = read_all_documents()
-                if documents.count() > 0:
-                    print("All Bus Arrival Documents:")
-                    for document in documents:
-                        print(document)
-                        print()
-                else:
-                    print("No bus arrival documents found.")
+                # Page through all documents
+                browse_history()
 
             elif view_option == "D":
                 # Get user input for the date
@@ -319,7 +508,7 @@ try:
                 try:
                     # Locate and display documents based on date
                     documents = read_documents_by_date(date_str)
-                    if documents.count() > 0:
+                    if documents:
                         print(f"Bus Arrival History for {date_str}:")
                         for document in documents:
                             print(document)
@@ -328,8 +517,34 @@ try:
                         print(f"No bus arrival history found for {date_str}")
                 except ValueError:
                     print("Invalid date format. Please enter the date in YYYY-MM-DD format.")
+            elif view_option == "S":
+                bus_stop_code = input("Enter Bus Stop Code: ")
+                service_no = input("Enter Service Number (press Enter for all services): ")
+                try:
+                    start = datetime.strptime(input("Enter the start time (YYYY-MM-DD HH:MM): "), "%Y-%m-%d %H:%M")
+                    end = datetime.strptime(input("Enter the end time (YYYY-MM-DD HH:MM): "), "%Y-%m-%d %H:%M")
+                    found = False
+                    for document in read_stop_history(bus_stop_code, int(start.replace(tzinfo=SGT).timestamp()),
+                                                      int(end.replace(tzinfo=SGT).timestamp()), service_no or None):
+                        print_history_document(document)
+                        found = True
+                    if not found:
+                        print(f"No bus arrival history found for bus stop {bus_stop_code} in that period.")
+                except ValueError:
+                    print("Invalid time format. Please enter the time in YYYY-MM-DD HH:MM format.")
+
+            elif view_option == "R":
+                # Summaries are aggregated on the server from the configured storage layout
+                date_str = input("Enter the date (YYYY-MM-DD, press Enter for all dates): ")
+                bus_stop_code = input("Enter Bus Stop Code (press Enter for all stops): ")
+                try:
+                    if date_str:
+                        datetime.strptime(date_str, "%Y-%m-%d")
+                    print_reports(db, ARRIVAL_STORAGE, date_str or None, bus_stop_code or None)
+                except ValueError:
+                    print("Invalid date format. Please enter the date in YYYY-MM-DD format.")
             else:
-                print("Invalid option. Please enter 'A' or 'D'.")
+                print("Invalid option. Please enter 'A', 'D', 'S' or 'R'.")
 
 
         elif choice == "3":
@@ -367,11 +582,19 @@ try:
             rollback_to_savepoint()
 
 
+        elif choice == "10":
+            # Continuously poll arrivals for every favorite bus stop
+            poll_favorite_bus_stops()
+
+
         elif choice == "0":
             # Exit the program
+            stats = arrival_cache.stats()
+            print(f"Arrival cache: {stats['hits']} hits, {stats['coalesced']} coalesced, {stats['misses']} misses "
+                  f"({stats['hit_rate']:.0%} served without a new request), {stats['evictions']} evictions")
             break
         else:
-            print("Invalid choice. Please enter a number between 0 and 9.")
+            print("Invalid choice. Please enter a number between 0 and 10.")
 
 
 except ValueError:
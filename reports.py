@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+import pymongo
+from arrivals import SGT, arrival_collection_name
+
+# Time bands used by the load distribution report, as [start hour, end hour) in Singapore time
+TIME_BANDS = [
+    ("Night", 0, 6),
+    ("AM Peak", 6, 9),
+    ("Midday", 9, 17),
+    ("PM Peak", 17, 20),
+    ("Evening", 20, 24),
+]
+
+# Compound indexes backing the reports' date/stop/service filters, per storage layout
+REPORT_INDEXES = {
+    "flat": [("Date", pymongo.ASCENDING), ("BusStopCode", pymongo.ASCENDING), ("ServiceNo", pymongo.ASCENDING)],
+    "bucketed": [("Date", pymongo.ASCENDING), ("BusStopCode", pymongo.ASCENDING), ("ServiceNo", pymongo.ASCENDING)],
+    "timeseries": [("meta.BusStopCode", pymongo.ASCENDING), ("meta.ServiceNo", pymongo.ASCENDING),
+                   ("poll_time", pymongo.ASCENDING)],
+}
+
+# Flat documents only keep the display text for the load, so it is mapped back to DataMall's code
+FLAT_LOAD_CODES = {
+    "[Green] Seats Available": "SEA",
+    "[Amber] Standing Available": "SDA",
+    "[Red] Limited Standing": "LSD",
+}
+
+
+def ensure_report_indexes(db, storage):
+    db[arrival_collection_name(storage)].create_index(REPORT_INDEXES[storage])
+
+
+# First stage of every report: filter on indexed fields before anything else runs
+def match_stage(storage, date=None, bus_stop_code=None):
+    match = {}
+    if storage == "timeseries":
+        if date:
+            start = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=SGT)
+            match["poll_time"] = {"$gte": start, "$lt": start + timedelta(days=1)}
+        if bus_stop_code:
+            match["meta.BusStopCode"] = bus_stop_code
+    else:
+        if date:
+            match["Date"] = date
+        if bus_stop_code:
+            match["BusStopCode"] = bus_stop_code
+    return {"$match": match}
+
+
+# Projects every layout onto the same fields: stop, service, hour, load, feature and headway
+# (seconds between the next two buses); fields a layout does not store come out as null
+def normalize_stages(storage):
+    if storage == "timeseries":
+        return [{"$project": {
+            "_id": 0,
+            "stop": "$meta.BusStopCode",
+            "service": "$meta.ServiceNo",
+            "hour": {"$hour": {"date": "$poll_time", "timezone": "+08:00"}},
+            "load": "$NextBus.Load",
+            "feature": "$NextBus.Feature",
+            "headway": {"$cond": [
+                {"$and": ["$NextBus.EstimatedArrival", "$NextBus2.EstimatedArrival"]},
+                {"$divide": [{"$subtract": [
+                    {"$dateFromString": {"dateString": "$NextBus2.EstimatedArrival"}},
+                    {"$dateFromString": {"dateString": "$NextBus.EstimatedArrival"}},
+                ]}, 1000]},
+                None,
+            ]},
+        }}]
+    if storage == "bucketed":
+        # Sample layout: [poll_ts, eta, load, type, feature, eta2, ...] (see BUCKET_SAMPLE_FIELDS)
+        return [
+            {"$unwind": "$samples"},
+            {"$project": {
+                "_id": 0,
+                "stop": "$BusStopCode",
+                "service": "$ServiceNo",
+                "hour": "$Hour",
+                "load": {"$arrayElemAt": ["$samples", 2]},
+                "feature": {"$arrayElemAt": ["$samples", 4]},
+                "headway": {"$subtract": [{"$arrayElemAt": ["$samples", 5]}, {"$arrayElemAt": ["$samples", 1]}]},
+            }},
+        ]
+    return [{"$project": {
+        "_id": 0,
+        "stop": "$BusStopCode",
+        "service": "$ServiceNo",
+        # Poll hour from PollTs (epoch seconds), or from the ObjectId for documents written before it existed
+        "hour": {"$hour": {"date": {"$ifNull": [{"$toDate": {"$multiply": ["$PollTs", 1000]}}, {"$toDate": "$_id"}]},
+                           "timezone": "+08:00"}},
+        "load": {"$switch": {
+            "branches": [{"case": {"$eq": ["$Load", text]}, "then": code} for text, code in FLAT_LOAD_CODES.items()],
+            "default": None,
+        }},
+        "feature": "$WheelchairAccessible",
+        "headway": {"$subtract": ["$NextBus2.EtaSeconds", "$EtaSeconds"]},
+    }}]
+
+
+def run_report(db, storage, stages, date=None, bus_stop_code=None):
+    pipeline = [match_stage(storage, date, bus_stop_code)] + normalize_stages(storage) + stages
+    return list(db[arrival_collection_name(storage)].aggregate(pipeline, allowDiskUse=True))
+
+
+# Average gap between consecutive buses for every service and hour of the day
+def headway_by_service_hour(db, storage, date=None, bus_stop_code=None):
+    return run_report(db, storage, [
+        {"$match": {"headway": {"$ne": None}}},
+        {"$group": {
+            "_id": {"service": "$service", "hour": "$hour"},
+            "avg_headway_seconds": {"$avg": "$headway"},
+            "samples": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "service": "$_id.service",
+            "hour": "$_id.hour",
+            "avg_headway_seconds": 1,
+            "samples": 1,
+        }},
+        {"$sort": {"service": 1, "hour": 1}},
+    ], date, bus_stop_code)
+
+
+def time_band_expression():
+    return {"$switch": {
+        "branches": [
+            {"case": {"$and": [{"$gte": ["$hour", start]}, {"$lt": ["$hour", end]}]}, "then": name}
+            for name, start, end in TIME_BANDS
+        ],
+        "default": "Unknown",
+    }}
+
+
+# Count of SEA/SDA/LSD readings for the next bus, per stop and time band
+def load_distribution(db, storage, date=None, bus_stop_code=None):
+    counts = {code: {"$sum": {"$cond": [{"$eq": ["$load", code]}, 1, 0]}} for code in ("SEA", "SDA", "LSD")}
+    return run_report(db, storage, [
+        {"$group": dict({"_id": {"stop": "$stop", "band": time_band_expression()}, "total": {"$sum": 1}}, **counts)},
+        {"$project": {"_id": 0, "stop": "$_id.stop", "band": "$_id.band", "total": 1,
+                      "SEA": 1, "SDA": 1, "LSD": 1}},
+        {"$sort": {"stop": 1, "band": 1}},
+    ], date, bus_stop_code)
+
+
+# Share of next-bus readings that were wheelchair accessible, per service
+def wheelchair_share(db, storage, date=None, bus_stop_code=None):
+    return run_report(db, storage, [
+        {"$group": {
+            "_id": "$service",
+            "total": {"$sum": 1},
+            "accessible": {"$sum": {"$cond": [{"$eq": ["$feature", "WAB"]}, 1, 0]}},
+        }},
+        {"$project": {
+            "_id": 0,
+            "service": "$_id",
+            "total": 1,
+            "accessible": 1,
+            "share": {"$divide": ["$accessible", "$total"]},
+        }},
+        {"$sort": {"service": 1}},
+    ], date, bus_stop_code)
+
+
+def print_reports(db, storage, date=None, bus_stop_code=None):
+    print("Average Headway per Service per Hour:")
+    for row in headway_by_service_hour(db, storage, date, bus_stop_code):
+        hour = f"{row['hour']:02d}:00" if row["hour"] is not None else "--:--"
+        print(f"   Service {row['service']:<6} {hour}  {row['avg_headway_seconds'] / 60:5.1f} mins "
+              f"({row['samples']} samples)")
+
+    print("\nLoad Distribution by Stop and Time Band:")
+    for row in load_distribution(db, storage, date, bus_stop_code):
+        print(f"   {row['stop']} {row['band']:<8} SEA {row['SEA']:>5}  SDA {row['SDA']:>5}  LSD {row['LSD']:>5}  "
+              f"(total {row['total']})")
+
+    print("\nWheelchair Accessible Share per Service:")
+    for row in wheelchair_share(db, storage, date, bus_stop_code):
+        print(f"   Service {row['service']:<6} {row['share']:.1%} ({row['accessible']}/{row['total']})")
+    print()
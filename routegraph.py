@@ -0,0 +1,266 @@
+import argparse
+import heapq
+import os
+import pickle
+import time
+from array import array
+from sql import PublicTransportDatabase
+
+CACHE_VERSION = 2
+
+
+def stop_key(bus_stop_code):
+    # BusStopCode has INT affinity, so "01012" is stored as 1012; accept either form
+    text = str(bus_stop_code).strip()
+    return int(text) if text.isdigit() else text
+
+
+class RouteGraph:
+    # Journey-planning graph over BusRoutes. Stops and service patterns (ServiceNo + Direction) are
+    # interned to integers and everything else lives in flat arrays:
+    #   - a CSR adjacency list of ride edges between consecutive stops of a pattern (target stop,
+    #     length in metres and pattern id per edge) for shortest-distance search, and
+    #   - the stop sequence of every pattern plus, per stop, the (pattern, position) pairs serving
+    #     it, for the fewest-transfers search.
+    def __init__(self, stop_codes, patterns, edge_offsets, edge_targets, edge_lengths, edge_patterns,
+                 pattern_offsets, pattern_stops, stop_pattern_offsets, stop_patterns, stop_positions):
+        self.stop_codes = stop_codes
+        self.stop_ids = {code: stop_id for stop_id, code in enumerate(stop_codes)}
+        self.patterns = patterns  # pattern id -> (ServiceNo, Direction)
+        self.edge_offsets = edge_offsets
+        self.edge_targets = edge_targets
+        self.edge_lengths = edge_lengths
+        self.edge_patterns = edge_patterns
+        self.pattern_offsets = pattern_offsets
+        self.pattern_stops = pattern_stops
+        self.stop_pattern_offsets = stop_pattern_offsets
+        self.stop_patterns = stop_patterns
+        self.stop_positions = stop_positions
+
+    # rows: (ServiceNo, Direction, StopSequence, BusStopCode, Distance) ordered by service,
+    # direction and stop sequence; Distance is DataMall's cumulative kilometres along the route
+    @classmethod
+    def build(cls, rows):
+        stop_ids = {}
+        stop_codes = []
+        patterns = []
+        pattern_offsets = array("l", [0])
+        pattern_stops = array("l")
+        sequences = []  # Per pattern: list of (stop id, cumulative distance)
+
+        current = None
+        for service_no, direction, _, bus_stop_code, distance in rows:
+            code = stop_key(bus_stop_code)
+            if code not in stop_ids:
+                stop_ids[code] = len(stop_codes)
+                stop_codes.append(code)
+            if (service_no, direction) != current:
+                current = (service_no, direction)
+                patterns.append(current)
+                sequences.append([])
+            sequences[-1].append((stop_ids[code], distance or 0.0))
+
+        edges = [[] for _ in stop_codes]
+        stop_pattern_lists = [[] for _ in stop_codes]
+        for pattern_id, sequence in enumerate(sequences):
+            for position, (stop_id, distance) in enumerate(sequence):
+                pattern_stops.append(stop_id)
+                stop_pattern_lists[stop_id].append((pattern_id, position))
+                if position + 1 < len(sequence):
+                    next_stop, next_distance = sequence[position + 1]
+                    length = max(0, round((next_distance - distance) * 1000))
+                    edges[stop_id].append((next_stop, length, pattern_id))
+            pattern_offsets.append(len(pattern_stops))
+
+        edge_offsets, edge_targets, edge_lengths, edge_patterns = array("l", [0]), array("l"), array("l"), array("l")
+        for stop_edges in edges:
+            for target, length, pattern_id in stop_edges:
+                edge_targets.append(target)
+                edge_lengths.append(length)
+                edge_patterns.append(pattern_id)
+            edge_offsets.append(len(edge_targets))
+
+        stop_pattern_offsets, stop_patterns, stop_positions = array("l", [0]), array("l"), array("l")
+        for pairs in stop_pattern_lists:
+            for pattern_id, position in pairs:
+                stop_patterns.append(pattern_id)
+                stop_positions.append(position)
+            stop_pattern_offsets.append(len(stop_patterns))
+
+        return cls(stop_codes, patterns, edge_offsets, edge_targets, edge_lengths, edge_patterns,
+                   pattern_offsets, pattern_stops, stop_pattern_offsets, stop_patterns, stop_positions)
+
+    @classmethod
+    def from_database(cls, db):
+        db.cursor.execute('''
+            SELECT ServiceNo, Direction, StopSequence, BusStopCode, Distance
+            FROM BusRoutes
+            ORDER BY ServiceNo, Direction, StopSequence
+        ''')
+        return cls.build(db.cursor)
+
+    # Identifies the BusRoutes contents a cached graph was built from. Inserts and deletes change the
+    # count or the highest RouteID; upserts keep a row's RouteID and key columns but may move it to
+    # another stop or distance, so those are summed weighted by RouteID to notice which row changed
+    @staticmethod
+    def fingerprint(db):
+        db.cursor.execute('''
+            SELECT COUNT(*), MAX(RouteID), TOTAL(StopSequence),
+                   TOTAL(RouteID * BusStopCode), TOTAL(RouteID * Distance)
+            FROM BusRoutes
+        ''')
+        return (CACHE_VERSION,) + tuple(db.cursor.fetchone())
+
+    def save(self, path, fingerprint):
+        state = dict(vars(self))
+        del state["stop_ids"]  # Rebuilt from stop_codes on load
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump((fingerprint, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+    # Loads the graph from the cache file next to the database, rebuilding (and re-caching) it
+    # from SQL only when BusRoutes has changed since the cache was written
+    @classmethod
+    def load(cls, db, cache_file=None):
+        cache_file = cache_file or db.db_file + ".routegraph"
+        fingerprint = cls.fingerprint(db)
+        try:
+            with open(cache_file, "rb") as f:
+                cached_fingerprint, state = pickle.load(f)
+            if cached_fingerprint == fingerprint:
+                state.pop("stop_ids", None)
+                return cls(**state)
+        except (OSError, pickle.UnpicklingError, EOFError, TypeError, ValueError):
+            pass
+
+        graph = cls.from_database(db)
+        try:
+            graph.save(cache_file, fingerprint)
+        except OSError as e:
+            print(f"Could not cache the route graph: {e}")
+        return graph
+
+    def stop_id(self, bus_stop_code):
+        return self.stop_ids.get(stop_key(bus_stop_code))
+
+    # Turns a list of (pattern id, board stop id, alight stop id) into readable legs
+    def describe_legs(self, legs):
+        return [
+            {
+                "ServiceNo": self.patterns[pattern_id][0],
+                "Direction": self.patterns[pattern_id][1],
+                "From": self.stop_codes[board],
+                "To": self.stop_codes[alight],
+            }
+            for pattern_id, board, alight in legs
+        ]
+
+    # Dijkstra over ride edges. Returns (metres, legs) for the shortest trip by distance, or None
+    def shortest_distance(self, origin, destination):
+        source, target = self.stop_id(origin), self.stop_id(destination)
+        if source is None or target is None:
+            return None
+
+        distances = {source: 0}
+        previous = {}  # stop id -> (previous stop id, pattern id of the edge used)
+        heap = [(0, source)]
+        while heap:
+            distance, stop = heapq.heappop(heap)
+            if stop == target:
+                break
+            if distance > distances[stop]:
+                continue
+            for edge in range(self.edge_offsets[stop], self.edge_offsets[stop + 1]):
+                next_stop = self.edge_targets[edge]
+                next_distance = distance + self.edge_lengths[edge]
+                if next_distance < distances.get(next_stop, next_distance + 1):
+                    distances[next_stop] = next_distance
+                    previous[next_stop] = (stop, self.edge_patterns[edge])
+                    heapq.heappush(heap, (next_distance, next_stop))
+        if target not in distances:
+            return None
+
+        # Walk back to the origin, merging consecutive edges on the same pattern into one leg
+        legs = []
+        stop = target
+        while stop != source:
+            prev_stop, pattern_id = previous[stop]
+            if legs and legs[-1][0] == pattern_id:
+                legs[-1] = (pattern_id, prev_stop, legs[-1][2])
+            else:
+                legs.append((pattern_id, prev_stop, stop))
+            stop = prev_stop
+        legs.reverse()
+        return distances[target], self.describe_legs(legs)
+
+    # Breadth-first search by number of rides: every stop reachable with n rides is found before
+    # any needing n + 1. Returns the legs of a trip with the fewest transfers, or None
+    def fewest_transfers(self, origin, destination):
+        source, target = self.stop_id(origin), self.stop_id(destination)
+        if source is None or target is None:
+            return None
+        if source == target:
+            return []
+
+        reached = {source: None}  # stop id -> (pattern id, board stop id) of the ride that reached it
+        frontier = [source]
+        while frontier and target not in reached:
+            boarded = {}  # pattern id -> earliest position boarded this round, so each pattern is ridden once
+            for stop in frontier:
+                for index in range(self.stop_pattern_offsets[stop], self.stop_pattern_offsets[stop + 1]):
+                    pattern_id, position = self.stop_patterns[index], self.stop_positions[index]
+                    if position < boarded.get(pattern_id, (position + 1,))[0]:
+                        boarded[pattern_id] = (position, stop)
+
+            next_frontier = []
+            for pattern_id, (position, board_stop) in boarded.items():
+                start = self.pattern_offsets[pattern_id]
+                for offset in range(start + position + 1, self.pattern_offsets[pattern_id + 1]):
+                    stop = self.pattern_stops[offset]
+                    if stop not in reached:
+                        reached[stop] = (pattern_id, board_stop)
+                        next_frontier.append(stop)
+            frontier = next_frontier
+        if target not in reached:
+            return None
+
+        legs = []
+        stop = target
+        while stop != source:
+            pattern_id, board_stop = reached[stop]
+            legs.append((pattern_id, board_stop, stop))
+            stop = board_stop
+        legs.reverse()
+        return self.describe_legs(legs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a bus trip between two stops from BusRoutes")
+    parser.add_argument("origin", help="Bus stop code to start from")
+    parser.add_argument("destination", help="Bus stop code to travel to")
+    parser.add_argument("--db", default="public_transport6.db")
+    args = parser.parse_args()
+
+    db = PublicTransportDatabase(args.db)
+    start = time.perf_counter()
+    graph = RouteGraph.load(db)
+    print(f"Loaded graph of {len(graph.stop_codes)} stops and {len(graph.patterns)} service patterns "
+          f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+    db.close()
+
+    for name, plan in (("Shortest distance", graph.shortest_distance), ("Fewest transfers", graph.fewest_transfers)):
+        start = time.perf_counter()
+        result = plan(args.origin, args.destination)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result is None:
+            print(f"{name}: no trip found ({elapsed:.2f} ms)")
+            continue
+        legs = result[1] if name == "Shortest distance" else result
+        summary = f"{result[0] / 1000:.1f} km, " if name == "Shortest distance" else ""
+        print(f"{name}: {summary}{len(legs)} ride(s), {max(0, len(legs) - 1)} transfer(s) ({elapsed:.2f} ms)")
+        for leg in legs:
+            print(f"   Service {leg['ServiceNo']} (direction {leg['Direction']}): {leg['From']} -> {leg['To']}")
+
+
+if __name__ == "__main__":
+    main()
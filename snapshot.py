@@ -0,0 +1,257 @@
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from sql import PublicTransportDatabase
+
+MAGIC = b"PTSNAP01"
+INT_NULL = -2 ** 63  # Stands in for NULL in integer columns; float columns use NaN
+
+# Tables in the snapshot and the columns their rows are sorted by; lookups binary-search the first
+SNAPSHOT_TABLES = {
+    "BusStops": ("BusStopCode",),
+    "BusServices": ("ServiceNo", "Direction"),
+    "BusRoutes": ("ServiceNo", "Direction", "StopSequence"),
+}
+
+
+def column_kind(values):
+    # "q": 64-bit integers, "d": doubles, "s": ids into the shared string table
+    if all(value is None or isinstance(value, int) for value in values):
+        return "q"
+    if all(value is None or isinstance(value, (int, float)) for value in values):
+        return "d"
+    return "s"
+
+
+def encode_column(kind, values, string_ids):
+    if kind == "q":
+        return array("q", (INT_NULL if value is None else value for value in values))
+    if kind == "d":
+        return array("d", (math.nan if value is None else value for value in values))
+    return array("i", (-1 if value is None else string_ids[str(value)] for value in values))
+
+
+def data_section_start(header_size):
+    start = len(MAGIC) + 8 + header_size
+    return start + -start % 8
+
+
+# Writes BusStops, BusServices and BusRoutes into one read-only columnar file:
+#   MAGIC | header length | JSON header | data section of 8-byte aligned blocks
+# Every column is a fixed-width array; text is interned into one string table (offsets + UTF-8
+# blob) sorted so that string id order matches text order, which keeps sorted columns searchable
+def export_snapshot(db, path):
+    tables = {}
+    strings = set()
+    for table in SNAPSHOT_TABLES:
+        db.cursor.execute(f"SELECT * FROM {table}")
+        names = [description[0] for description in db.cursor.description]
+        rows = db.cursor.fetchall()
+        columns = [[row[index] for row in rows] for index in range(len(names))]
+        kinds = [column_kind(values) for values in columns]
+        for kind, values in zip(kinds, columns):
+            if kind == "s":
+                strings.update(str(value) for value in values if value is not None)
+        tables[table] = (names, kinds, columns, len(rows))
+
+    string_table = sorted(strings)
+    string_ids = {text: string_id for string_id, text in enumerate(string_table)}
+    blob = bytearray()
+    string_offsets = array("q", [0])
+    for text in string_table:
+        blob += text.encode("utf-8")
+        string_offsets.append(len(blob))
+
+    blocks = []
+
+    def add_block(data):
+        blocks.append(data)
+        return len(blocks) - 1
+
+    header = {
+        "strings": {"count": len(string_table), "offsets": add_block(string_offsets.tobytes()),
+                    "blob": add_block(bytes(blob))},
+        "tables": {},
+    }
+    for table, (names, kinds, columns, row_count) in tables.items():
+        encoded = [encode_column(kind, values, string_ids) for kind, values in zip(kinds, columns)]
+        # Sort rows by the table's key columns (string ids compare like the text they stand for)
+        key_columns = [encoded[names.index(name)] for name in SNAPSHOT_TABLES[table] if name in names]
+        order = sorted(range(row_count), key=lambda i: tuple(
+            -math.inf if column.typecode == "d" and math.isnan(column[i]) else column[i] for column in key_columns))
+        header["tables"][table] = {
+            "rows": row_count,
+            "key": [name for name in SNAPSHOT_TABLES[table] if name in names],
+            "columns": [
+                {"name": name, "kind": kind, "block": add_block(array(column.typecode, (column[i] for i in order)).tobytes())}
+                for name, kind, column in zip(names, kinds, encoded)
+            ],
+        }
+
+    # Block offsets are relative to the data section, which starts 8-byte aligned after the header
+    offsets = []
+    offset = 0
+    for data in blocks:
+        offset += -offset % 8
+        offsets.append([offset, len(data)])
+        offset += len(data)
+    header_bytes = json.dumps({"blocks": offsets, **header}).encode()
+    data_start = data_section_start(len(header_bytes))
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(MAGIC + struct.pack("<q", len(header_bytes)) + header_bytes)
+        for (block_offset, _), data in zip(offsets, blocks):
+            f.write(b"\0" * (data_start + block_offset - f.tell()))
+            f.write(data)
+    os.replace(path + ".tmp", path)
+
+
+class SnapshotTable:
+    def __init__(self, snapshot, spec):
+        self.snapshot = snapshot
+        self.rows = spec["rows"]
+        self.key = spec["key"]
+        self.names = [column["name"] for column in spec["columns"]]
+        self.kinds = {column["name"]: column["kind"] for column in spec["columns"]}
+        typecodes = {"q": "q", "d": "d", "s": "i"}
+        self.columns = {column["name"]: snapshot.block(column["block"], typecodes[column["kind"]])
+                        for column in spec["columns"]}
+
+    def __len__(self):
+        return self.rows
+
+    def value(self, name, index):
+        raw = self.columns[name][index]
+        kind = self.kinds[name]
+        if kind == "s":
+            return self.snapshot.string(raw)
+        if kind == "d":
+            return None if math.isnan(raw) else raw
+        return None if raw == INT_NULL else raw
+
+    def row(self, index):
+        return tuple(self.value(name, index) for name in self.names)
+
+    def encode(self, name, value):
+        # Converts a lookup value the way SQLite's column affinity would before comparing
+        kind = self.kinds[name]
+        try:
+            if kind == "q":
+                return int(value)
+            if kind == "d":
+                return float(value)
+        except (TypeError, ValueError):
+            return None
+        return self.snapshot.string_id(str(value))
+
+    # Row indices whose first key column equals value, found by binary search on the sorted column
+    def find(self, value):
+        name = self.key[0]
+        encoded = self.encode(name, value)
+        if encoded is None:
+            return range(0)
+        column = self.columns[name]
+        return range(bisect.bisect_left(column, encoded), bisect.bisect_right(column, encoded))
+
+
+class NetworkSnapshot:
+    # Read-only, memory-mapped view of a snapshot written by export_snapshot. Opening it only parses
+    # the header; columns are read straight from the mapping, so any number of worker processes can
+    # share the same pages. Offers the same lookups as PublicTransportDatabase (get_bus_stop,
+    # get_bus_service), so select_specific_bus_stop and select_bus_service run against either.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = []
+        if self.mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a network snapshot")
+        header_size = struct.unpack_from("<q", self.mm, len(MAGIC))[0]
+        start = len(MAGIC) + 8
+        self.header = json.loads(bytes(self.mm[start:start + header_size]))
+        self.data_start = data_section_start(header_size)
+        self.data = memoryview(self.mm)
+        self.views.append(self.data)
+
+        strings = self.header["strings"]
+        self.string_count = strings["count"]
+        self.string_offsets = self.block(strings["offsets"], "q")
+        self.string_blob = self.block(strings["blob"], "B")
+        self.string_cache = {}
+        self.tables = {name: SnapshotTable(self, spec) for name, spec in self.header["tables"].items()}
+
+    def block(self, number, typecode):
+        offset, size = self.header["blocks"][number]
+        offset += self.data_start
+        view = self.data[offset:offset + size].cast(typecode)
+        self.views.append(view)
+        return view
+
+    def string(self, string_id):
+        if string_id < 0:
+            return None
+        text = self.string_cache.get(string_id)
+        if text is None:
+            text = str(self.string_blob[self.string_offsets[string_id]:self.string_offsets[string_id + 1]], "utf-8")
+            self.string_cache[string_id] = text
+        return text
+
+    def string_id(self, text):
+        # The string table is sorted, so ids are found by binary search
+        low, high = 0, self.string_count
+        while low < high:
+            middle = (low + high) // 2
+            if self.string(middle) < text:
+                low = middle + 1
+            else:
+                high = middle
+        return low if low < self.string_count and self.string(low) == text else None
+
+    def get_bus_stop(self, bus_stop_code):
+        table = self.tables["BusStops"]
+        rows = table.find(bus_stop_code)
+        return table.row(rows[0]) if rows else None
+
+    def get_bus_service(self, service_no):
+        table = self.tables["BusServices"]
+        rows = table.find(service_no)
+        return table.row(rows[0]) if rows else None
+
+    def get_service_routes(self, service_no):
+        table = self.tables["BusRoutes"]
+        return [table.row(index) for index in table.find(service_no)]
+
+    def close(self):
+        for view in reversed(self.views):
+            view.release()
+        self.mm.close()
+        self.file.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the static bus network to a memory-mappable snapshot")
+    parser.add_argument("--db", default="public_transport6.db")
+    parser.add_argument("--out", default="public_transport6.snapshot")
+    args = parser.parse_args()
+
+    db = PublicTransportDatabase(args.db)
+    start = time.perf_counter()
+    export_snapshot(db, args.out)
+    db.close()
+    print(f"Wrote {args.out} ({os.path.getsize(args.out):,} bytes) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    snapshot = NetworkSnapshot(args.out)
+    counts = ", ".join(f"{len(table)} {name}" for name, table in snapshot.tables.items())
+    print(f"Opened snapshot with {counts} in {(time.perf_counter() - start) * 1000:.2f} ms")
+    snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
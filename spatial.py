@@ -0,0 +1,98 @@
+import heapq
+import math
+
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEGREE = EARTH_RADIUS_M * math.pi / 180
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class StopGrid:
+    # In-memory spatial index over bus stops: a uniform grid of roughly cell_size x cell_size metre
+    # cells, each holding the stops inside it. Radius and k-nearest queries only visit the cells
+    # around the query point and compute exact haversine distances for the stops found there.
+    # Rows are (BusStopCode, RoadName, Description, Latitude, Longitude), as stored in BusStops.
+    def __init__(self, stops, cell_size=250):
+        self.rows = [stop for stop in stops if stop[3] is not None and stop[4] is not None]
+        self.cell_size = cell_size
+        mean_lat = sum(row[3] for row in self.rows) / len(self.rows) if self.rows else 0.0
+        self.cell_lat = cell_size / METRES_PER_DEGREE
+        self.cell_lon = self.cell_lat / math.cos(math.radians(mean_lat))
+
+        self.cells = {}
+        for index, row in enumerate(self.rows):
+            self.cells.setdefault(self.cell(row[3], row[4]), []).append(index)
+        keys = self.cells.keys()
+        self.bounds = (min((i for i, _ in keys), default=0), max((i for i, _ in keys), default=0),
+                       min((j for _, j in keys), default=0), max((j for _, j in keys), default=0))
+
+    @classmethod
+    def from_database(cls, db, cell_size=250):
+        db.cursor.execute("SELECT BusStopCode, RoadName, Description, Latitude, Longitude FROM BusStops")
+        return cls(db.cursor.fetchall(), cell_size)
+
+    def cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_lat)), int(math.floor(lon / self.cell_lon))
+
+    def cell_width(self, lat):
+        # East-west size of a cell in metres at the given latitude
+        return self.cell_lon * METRES_PER_DEGREE * math.cos(math.radians(lat))
+
+    def candidates(self, ci, cj, ring):
+        # Stop indices in the cells exactly `ring` steps away from (ci, cj)
+        if ring == 0:
+            yield from self.cells.get((ci, cj), ())
+            return
+        for i in range(ci - ring, ci + ring + 1):
+            for j in (cj - ring, cj + ring):
+                yield from self.cells.get((i, j), ())
+        for j in range(cj - ring + 1, cj + ring):
+            for i in (ci - ring, ci + ring):
+                yield from self.cells.get((i, j), ())
+
+    # Stops within radius_m metres of the point, nearest first, as (distance in metres, row)
+    def within(self, lat, lon, radius_m):
+        ci, cj = self.cell(lat, lon)
+        di = math.ceil(radius_m / self.cell_size)
+        dj = math.ceil(radius_m / self.cell_width(lat))
+        results = []
+        for i in range(ci - di, ci + di + 1):
+            for j in range(cj - dj, cj + dj + 1):
+                for index in self.cells.get((i, j), ()):
+                    row = self.rows[index]
+                    distance = haversine(lat, lon, row[3], row[4])
+                    if distance <= radius_m:
+                        results.append((distance, row))
+        results.sort(key=lambda result: result[0])
+        return results
+
+    # The k stops nearest to the point, nearest first, as (distance in metres, row). Rings of cells
+    # are searched outwards until no unvisited cell can hold anything closer than the k-th best
+    def nearest(self, lat, lon, k=5):
+        if not self.rows or k <= 0:
+            return []
+        ci, cj = self.cell(lat, lon)
+        min_cell = min(self.cell_size, self.cell_width(lat))
+        max_ring = max(abs(ci - self.bounds[0]), abs(ci - self.bounds[1]),
+                       abs(cj - self.bounds[2]), abs(cj - self.bounds[3]))
+        best = []  # Max-heap of (-distance, index) holding the k closest so far
+        ring = 0
+        while ring <= max_ring:
+            for index in self.candidates(ci, cj, ring):
+                row = self.rows[index]
+                distance = haversine(lat, lon, row[3], row[4])
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, index))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, index))
+            # Anything outside rings 0..ring is at least `ring` whole cells away
+            if len(best) >= k and -best[0][0] <= ring * min_cell:
+                break
+            ring += 1
+        return [(-distance, self.rows[index]) for distance, index in sorted(best, reverse=True)]
@@ -1,134 +1,292 @@
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
-import requests
 import sqlite3
+import time
+import json
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
+from datamall import DATAMALL_URL, get_client
+
+# Upserts keyed on each table's natural key, so a refresh updates rows that changed upstream
+UPSERT_QUERIES = {
+    "BusRoutes": '''
+        INSERT INTO BusRoutes (ServiceNo, Operator, Direction, StopSequence, BusStopCode, Distance,
+        WD_FirstBus, WD_LastBus, SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (ServiceNo, Direction, StopSequence) DO UPDATE SET
+            Operator = excluded.Operator, BusStopCode = excluded.BusStopCode, Distance = excluded.Distance,
+            WD_FirstBus = excluded.WD_FirstBus, WD_LastBus = excluded.WD_LastBus,
+            SAT_FirstBus = excluded.SAT_FirstBus, SAT_LastBus = excluded.SAT_LastBus,
+            SUN_FirstBus = excluded.SUN_FirstBus, SUN_LastBus = excluded.SUN_LastBus
+    ''',
+    "BusServices": '''
+        INSERT INTO BusServices (ServiceNo, Operator, Direction, Category, OriginCode, DestinationCode,
+        AM_Peak_Freq, AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq, LoopDesc)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (ServiceNo, Direction) DO UPDATE SET
+            Operator = excluded.Operator, Category = excluded.Category,
+            OriginCode = excluded.OriginCode, DestinationCode = excluded.DestinationCode,
+            AM_Peak_Freq = excluded.AM_Peak_Freq, AM_Offpeak_Freq = excluded.AM_Offpeak_Freq,
+            PM_Peak_Freq = excluded.PM_Peak_Freq, PM_Offpeak_Freq = excluded.PM_Offpeak_Freq,
+            LoopDesc = excluded.LoopDesc
+    ''',
+    "BusStops": '''
+        INSERT INTO BusStops (BusStopCode, RoadName, Description, Latitude, Longitude)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (BusStopCode) DO UPDATE SET
+            RoadName = excluded.RoadName, Description = excluded.Description,
+            Latitude = excluded.Latitude, Longitude = excluded.Longitude
+    ''',
+}
+
+DELETE_QUERIES = {
+    "BusRoutes": "DELETE FROM BusRoutes WHERE ServiceNo = ? AND Direction = ? AND StopSequence = ?",
+    "BusServices": "DELETE FROM BusServices WHERE ServiceNo = ? AND Direction = ?",
+    "BusStops": "DELETE FROM BusStops WHERE BusStopCode = ?",
+}
+
+# Positions of the natural key columns in the rows built by bus_route_row / bus_service_row / bus_stop_row
+ROW_KEY_INDICES = {
+    "BusRoutes": (0, 2, 3),
+    "BusServices": (0, 2),
+    "BusStops": (0,),
+}
+
+# Ordered schema migrations as (version, description, statements). Each one runs once,
+# on startup, and records its version in the schema_version table. Only append new entries.
+MIGRATIONS = [
+    (1, "Unique route key and route lookup indexes", [
+        # Drop duplicate rows left by older per-row inserts before enforcing the key
+        '''
+        DELETE FROM BusRoutes WHERE RouteID NOT IN (
+            SELECT MAX(RouteID) FROM BusRoutes GROUP BY ServiceNo, Direction, StopSequence
+        )
+        ''',
+        # Conflict target for route upserts; its leading column also serves ServiceNo lookups
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_busroutes_service_direction_sequence
+        ON BusRoutes (ServiceNo, Direction, StopSequence)
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_busroutes_stop_service ON BusRoutes (BusStopCode, ServiceNo)",
+    ]),
+    (2, "Unique favorite stops and services", [
+        "DELETE FROM FavoriteStop WHERE ID NOT IN (SELECT MIN(ID) FROM FavoriteStop GROUP BY BusStopCode)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_favoritestop_busstopcode ON FavoriteStop (BusStopCode)",
+        "DELETE FROM FavoriteService WHERE ID NOT IN (SELECT MIN(ID) FROM FavoriteService GROUP BY ServiceNo)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_favoriteservice_serviceno ON FavoriteService (ServiceNo)",
+    ]),
+    (3, "Natural-order service number indexes for sorting", [
+        # Match SORT_EXPRESSIONS["ServiceNo"] so sorted pages are read in index order
+        "CREATE INDEX IF NOT EXISTS idx_busroutes_service_natural ON BusRoutes (CAST(ServiceNo AS INTEGER), ServiceNo)",
+        "CREATE INDEX IF NOT EXISTS idx_busservices_service_natural ON BusServices (CAST(ServiceNo AS INTEGER), ServiceNo)",
+    ]),
+    (4, "Covering indexes for stop/service route lookups", [
+        # Serves services_at_stop from the index alone; its (BusStopCode, ServiceNo) prefix replaces
+        # the narrower index from migration 1
+        "DROP INDEX IF EXISTS idx_busroutes_stop_service",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_busroutes_stop_covering
+        ON BusRoutes (BusStopCode, ServiceNo, Direction, StopSequence)
+        ''',
+        # Serves stops_on_service, in stop order, from the index alone
+        '''
+        CREATE INDEX IF NOT EXISTS idx_busroutes_service_stops_covering
+        ON BusRoutes (ServiceNo, Direction, StopSequence, BusStopCode, Distance)
+        ''',
+    ]),
+    (5, "Key bus services on service number and direction", [
+        # DataMall lists every direction of a service as its own row; keyed on ServiceNo alone, only
+        # one direction could be stored. SQLite cannot change a primary key in place, so the table
+        # is rebuilt, and BusRoutes with it so its foreign key can reference the new composite key
+        '''
+        CREATE TABLE BusServices_new (
+            ServiceNo VARCHAR,
+            Operator TEXT,
+            Direction INT,
+            Category VARCHAR(255),
+            Origincode INT,
+            DestinationCode INT,
+            AM_Peak_Freq INT,
+            AM_Offpeak_Freq INT,
+            PM_Peak_Freq INT,
+            PM_Offpeak_Freq INT,
+            LoopDesc TEXT,
+            PRIMARY KEY (ServiceNo, Direction)
+        )
+        ''',
+        "INSERT INTO BusServices_new SELECT * FROM BusServices",
+        "DROP TABLE BusServices",
+        "ALTER TABLE BusServices_new RENAME TO BusServices",
+        "CREATE INDEX IF NOT EXISTS idx_busservices_service_natural ON BusServices (CAST(ServiceNo AS INTEGER), ServiceNo)",
+        '''
+        CREATE TABLE BusRoutes_new (
+            RouteID INTEGER PRIMARY KEY AUTOINCREMENT,
+            ServiceNo VARCHAR(255),
+            Operator TEXT,
+            Direction INT,
+            StopSequence INT,
+            BusStopCode INT,
+            Distance FLOAT,
+            WD_FirstBus TIME,
+            WD_LastBus TIME,
+            SAT_FirstBus TIME,
+            SAT_LastBus TIME,
+            SUN_FirstBus TIME,
+            SUN_LastBus TIME,
+            FOREIGN KEY (BusStopCode) REFERENCES BusStops(BusStopCode),
+            FOREIGN KEY (ServiceNo, Direction) REFERENCES BusServices(ServiceNo, Direction)
+        )
+        ''',
+        "INSERT INTO BusRoutes_new SELECT * FROM BusRoutes",
+        "DROP TABLE BusRoutes",
+        "ALTER TABLE BusRoutes_new RENAME TO BusRoutes",
+        # Dropping the table dropped its indexes from migrations 1, 3 and 4
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_busroutes_service_direction_sequence
+        ON BusRoutes (ServiceNo, Direction, StopSequence)
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_busroutes_service_natural ON BusRoutes (CAST(ServiceNo AS INTEGER), ServiceNo)",
+        '''
+        CREATE INDEX IF NOT EXISTS idx_busroutes_stop_covering
+        ON BusRoutes (BusStopCode, ServiceNo, Direction, StopSequence)
+        ''',
+        '''
+        CREATE INDEX IF NOT EXISTS idx_busroutes_service_stops_covering
+        ON BusRoutes (ServiceNo, Direction, StopSequence, BusStopCode, Distance)
+        ''',
+    ]),
+    (6, "Row hashes for bus services keyed on service number and direction", [
+        # Hashes stored under the old ServiceNo-only keys would all look removed; the next
+        # incremental sync stores every service afresh instead
+        "DELETE FROM RowHashes WHERE Category = 'BusServices'",
+    ]),
+]
+
+# PRAGMA settings per workload. "bulk_load" favours write throughput for API ingestion,
+# "interactive" favours fast reads for the GUI, and "default" restores SQLite's defaults.
+CONNECTION_PROFILES = {
+    "interactive": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "foreign_keys": "ON",
+        "cache_size": -16000,  # Negative sizes are in KiB
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "bulk_load": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "foreign_keys": "OFF",  # Datasets can be loaded in any order
+        "cache_size": -131072,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "default": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "foreign_keys": "OFF",
+        "cache_size": -2000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+    },
+}
+
+# Prepared statements kept per connection (sqlite3 defaults to 128)
+STATEMENT_CACHE_SIZE = 512
+
+PAGE_SIZE = 500  # DataMall returns at most 500 records per $skip page
+
+ROUTE_CACHE_SIZE = 4096  # Keys kept by each of the services_at_stop / stops_on_service caches
+
 
 class LTADataFetcher:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url=DATAMALL_URL, max_in_flight=4, client=None):
         self.api_key = api_key
-
-    def get_bus_routes(self):
-        api_url = 'http://datamall2.mytransport.sg/ltaodataservice/BusRoutes'
-        all_bus_routes = []
+        self.max_in_flight = max(1, max_in_flight)  # Maximum number of page requests in flight at once
+        # Pooled, rate-limited client shared with every other DataMall caller in the process
+        self.client = client or get_client(api_key, base_url, pool_size=self.max_in_flight)
+
+    def fetch_page(self, dataset, skip):
+        return self.client.get_json(dataset, {"$skip": skip}).get("value", [])
+
+    def iter_pages(self, dataset):
+        # Probe ahead in $skip steps with up to max_in_flight requests outstanding.
+        # Pages are yielded in $skip order, so records keep the original API order,
+        # and fetching stops at the first short page.
+        in_flight = {}
+        next_skip = 0
         skip = 0
-        while True:
-            headers = {
-                'AccountKey': self.api_key,
-                'accept': 'application/json'
-            }
-
-            params = {
-                '$skip': skip
-            }
-
-            try:
-                response = requests.get(api_url, headers=headers, params=params)
-                response.raise_for_status()
-
-                data = response.json()
-
-                if 'value' in data:
-                    all_bus_routes.extend(data['value'])
-                    if len(data['value']) < 500:
-                        break
-                    print(f"Retrieved data with $skip={skip}")
-                else:
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        try:
+            while True:
+                while len(in_flight) < self.max_in_flight:
+                    in_flight[next_skip] = executor.submit(self.fetch_page, dataset, next_skip)
+                    next_skip += PAGE_SIZE
+
+                page = in_flight.pop(skip).result()
+                yield page
+                if len(page) < PAGE_SIZE:
                     break
-            except requests.exceptions.RequestException as e:
-                print(f"An error occurred while fetching bus routes: {e}")
-                return []
-            except ValueError as e:
-                print(f"Failed to parse the JSON response for bus routes: {e}")
-                return []
+                print(f"Retrieved data with $skip={skip}")
+                skip += PAGE_SIZE
+        finally:
+            # Drop any speculative requests past the last page
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def fetch_all_pages(self, dataset):
+        all_records = []
+        for page in self.iter_pages(dataset):
+            all_records.extend(page)
+        return all_records
 
-            skip += 500
-
-        return all_bus_routes
+    def get_bus_routes(self):
+        return self.fetch_all_pages("BusRoutes")
 
     def get_bus_services(self):
-        api_url = "http://datamall2.mytransport.sg/ltaodataservice/BusServices"
-        all_bus_services = []
-        skip = 0
-        while True:
-            headers = {
-                "AccountKey": self.api_key,
-                "accept": "application/json"
-            }
-
-            params = {
-                "$skip": skip
-            }
-
-            response = requests.get(api_url, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if "value" in data:
-                    all_bus_services.extend(data["value"])
-                    if len(data["value"]) < 500:
-                        break
-                    print(f"Retrieved data with $skip={skip}")
-                else:
-                    break
-            else:
-                raise Exception(f"Failed to fetch data from the API. Status code: {response.status_code}")
-
-            skip += 500
-
-        return all_bus_services
+        return self.fetch_all_pages("BusServices")
 
     def get_bus_stops(self):
-        api_url = "http://datamall2.mytransport.sg/ltaodataservice/BusStops"
-        all_bus_stops = []
-        skip = 0
-        while True:
-            headers = {
-                "AccountKey": self.api_key,
-                "accept": "application/json"
-            }
-
-            params = {
-                "$skip": skip
-            }
-
-            response = requests.get(api_url, headers=headers, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if "value" in data:
-                    all_bus_stops.extend(data["value"])
-                    if len(data["value"]) < 500:
-                        break
-                    print(f"Retrieved data with $skip={skip}")
-                else:
-                    break
-            else:
-                raise Exception(f"Failed to fetch data from the API. Status code: {response.status_code}")
-
-            skip += 500
-
-        return all_bus_stops
+        return self.fetch_all_pages("BusStops")
 
 
 class PublicTransportDatabase:
-    def __init__(self, db_file):
-        self.conn = sqlite3.connect(db_file)
+    def __init__(self, db_file, profile="interactive"):
+        self.db_file = db_file
+        # Autocommit mode: transactions are opened explicitly by begin_transaction
+        self.conn = sqlite3.connect(db_file, isolation_level=None, cached_statements=STATEMENT_CACHE_SIZE)
         self.cursor = self.conn.cursor()
+        self.profile = None
+        self.use_profile(profile)
+        # LRU caches of route lookups, emptied whenever this or another connection changes the database
+        self.stop_services_cache = OrderedDict()
+        self.service_stops_cache = OrderedDict()
+        self.cached_data_version = None
 
     def close(self):
         self.conn.close()
 
+    def use_profile(self, profile):
+        # Apply the PRAGMA settings of a connection profile; returns the previous profile name
+        previous = self.profile
+        for pragma, value in CONNECTION_PROFILES[profile].items():
+            self.conn.execute(f"PRAGMA {pragma} = {value}")
+        self.profile = profile
+        return previous
+
     def begin_transaction(self):
-        self.conn.isolation_level = None  # Set to autocommit mode (default is DEFERRED)
         self.conn.execute('BEGIN TRANSACTION')
 
     def commit_transaction(self):
         self.conn.execute('COMMIT')
-        self.conn.isolation_level = ''  # Set back to default (DEFERRED)
+        self.clear_route_caches()
 
     def rollback_transaction(self):
         self.conn.execute('ROLLBACK')
-        self.conn.isolation_level = ''  # Set back to default (DEFERRED)
 
     def create_tables(self):
         # Create the necessary tables in the database
@@ -192,8 +350,57 @@ class PublicTransportDatabase:
             )
         ''')
 
+        # Content hash of every row written by a refresh, keyed by category and natural key
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS RowHashes (
+                Category TEXT,
+                RowKey TEXT,
+                RowHash TEXT,
+                PRIMARY KEY (Category, RowKey)
+            ) WITHOUT ROWID
+        ''')
+
         self.conn.commit()
 
+        # Bring the schema up to date with any migrations not yet applied
+        self.migrate()
+
+    def schema_version(self):
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        self.cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        return self.cursor.fetchone()[0]
+
+    def migrate(self):
+        # Apply pending migrations in order, each in its own transaction. Foreign keys are off
+        # while they run, since rebuilding a table drops and renames tables others reference
+        current = self.schema_version()
+        foreign_keys = self.conn.execute("PRAGMA foreign_keys").fetchone()[0]
+        self.conn.execute("PRAGMA foreign_keys = OFF")
+        try:
+            for version, description, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                self.begin_transaction()
+                try:
+                    for statement in statements:
+                        self.cursor.execute(statement)
+                    self.cursor.execute("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                                        (version, description))
+                    self.commit_transaction()
+                    print(f"Applied schema migration {version}: {description}")
+                except Exception as e:
+                    print(f"An error occurred while applying schema migration {version}: {e}")
+                    self.rollback_transaction()
+                    raise
+        finally:
+            self.conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+
     def check_bus_route_exists(self, ServiceNo, BusStopCode):
         # Check if a bus route with the given ServiceNo and BusStopCode already exists in the database
         self.cursor.execute("SELECT 1 FROM BusRoutes WHERE ServiceNo = ? AND BusStopCode = ?", (ServiceNo, BusStopCode))
@@ -203,14 +410,10 @@ class PublicTransportDatabase:
                          WD_FirstBus, WD_LastBus, SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus):
         self.begin_transaction()
         try:
-            # Insert bus routes into the database if they don't exist
-            if not self.check_bus_route_exists(ServiceNo, BusStopCode):
-                self.cursor.execute('''
-                    INSERT INTO BusRoutes (ServiceNo, Operator, Direction, StopSequence, BusStopCode, Distance, 
-                    WD_FirstBus, WD_LastBus, SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (ServiceNo, Operator, Direction, StopSequence, BusStopCode, Distance,
-                      WD_FirstBus, WD_LastBus, SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus))
+            # Insert the bus route, or update it if it changed since it was stored
+            self.cursor.execute(UPSERT_QUERIES["BusRoutes"], (ServiceNo, Operator, Direction, StopSequence,
+                                                               BusStopCode, Distance, WD_FirstBus, WD_LastBus,
+                                                               SAT_FirstBus, SAT_LastBus, SUN_FirstBus, SUN_LastBus))
             self.commit_transaction()
         except Exception as e:
             # Rollback the transaction in case of an exception
@@ -226,14 +429,11 @@ class PublicTransportDatabase:
                            AM_Peak_Freq, AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq, LoopDesc):
         self.begin_transaction()
         try:
-            # Insert bus services into the database if they don't exist
-            if not self.check_bus_service_exists(ServiceNo):
-                self.cursor.execute('''
-                    INSERT INTO BusServices (ServiceNo, Operator, Direction, Category, OriginCode, DestinationCode, 
-                    AM_Peak_Freq, AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq, LoopDesc)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (ServiceNo, Operator, Direction, Category, OriginCode, DestinationCode,
-                      AM_Peak_Freq, AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq, LoopDesc))
+            # Insert the bus service, or update it if it changed since it was stored
+            self.cursor.execute(UPSERT_QUERIES["BusServices"], (ServiceNo, Operator, Direction, Category,
+                                                                 OriginCode, DestinationCode, AM_Peak_Freq,
+                                                                 AM_Offpeak_Freq, PM_Peak_Freq, PM_Offpeak_Freq,
+                                                                 LoopDesc))
             self.commit_transaction()
         except Exception as e:
             # Rollback the transaction in case of an exception
@@ -248,186 +448,618 @@ class PublicTransportDatabase:
     def insert_bus_stop(self, BusStopCode, RoadName, Description, Latitude, Longitude):
         self.begin_transaction()
         try:
-            # Insert bus stops into the database if they don't exist
-            if not self.check_bus_stop_exists(BusStopCode):
-                self.cursor.execute('''
-                    INSERT INTO BusStops (BusStopCode, RoadName, Description, Latitude, Longitude)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (BusStopCode, RoadName, Description, Latitude, Longitude))
+            # Insert the bus stop, or update it if it changed since it was stored
+            self.cursor.execute(UPSERT_QUERIES["BusStops"], (BusStopCode, RoadName, Description, Latitude, Longitude))
             self.commit_transaction()
         except Exception as e:
             # Rollback the transaction in case of an exception
             print(f"An error occurred while inserting bus stop: {e}")
             self.rollback_transaction()
 
+    def get_bus_stop(self, BusStopCode):
+        self.cursor.execute("SELECT * FROM BusStops WHERE BusStopCode = ?", (BusStopCode,))
+        return self.cursor.fetchone()
+
+    def get_bus_service(self, ServiceNo):
+        # Services are stored per direction; show the first
+        self.cursor.execute("SELECT * FROM BusServices WHERE ServiceNo = ? ORDER BY Direction", (ServiceNo,))
+        return self.cursor.fetchone()
+
+    def clear_route_caches(self):
+        self.stop_services_cache.clear()
+        self.service_stops_cache.clear()
+
+    def cached_lookup(self, cache, key, query, params):
+        # PRAGMA data_version changes when another connection (e.g. a BackgroundTask refresh)
+        # commits; commits on this connection clear the caches in commit_transaction
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.cached_data_version:
+            self.clear_route_caches()
+            self.cached_data_version = data_version
+        rows = cache.get(key)
+        if rows is not None:
+            cache.move_to_end(key)
+            return rows
+        rows = tuple(self.cursor.execute(query, params).fetchall())
+        cache[key] = rows
+        if len(cache) > ROUTE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return rows
+
+    # Services calling at a stop as (ServiceNo, Direction, StopSequence) tuples
+    def services_at_stop(self, BusStopCode):
+        key = int(BusStopCode) if str(BusStopCode).isdigit() else BusStopCode
+        return self.cached_lookup(self.stop_services_cache, key, '''
+            SELECT ServiceNo, Direction, StopSequence FROM BusRoutes
+            WHERE BusStopCode = ?
+            ORDER BY ServiceNo, Direction, StopSequence
+        ''', (key,))
+
+    # Stops of one direction of a service in order, as (StopSequence, BusStopCode, Distance) tuples
+    def stops_on_service(self, ServiceNo, Direction=1):
+        key = (str(ServiceNo), int(Direction))
+        return self.cached_lookup(self.service_stops_cache, key, '''
+            SELECT StopSequence, BusStopCode, Distance FROM BusRoutes
+            WHERE ServiceNo = ? AND Direction = ?
+            ORDER BY StopSequence
+        ''', key)
+
+    def store_row_hashes(self, category, rows):
+        self.cursor.executemany('''
+            INSERT INTO RowHashes (Category, RowKey, RowHash) VALUES (?, ?, ?)
+            ON CONFLICT (Category, RowKey) DO UPDATE SET RowHash = excluded.RowHash
+        ''', [(category, row_key(category, row), row_hash(row)) for row in rows])
+
+    def bulk_upsert(self, category, rows, batch_size=500):
+        # Write all rows through executemany in batches, under a single transaction. Row hashes
+        # are kept up to date as well, so a later incremental sync compares against these rows
+        # and can remove them once they disappear upstream
+        count = 0
+        batch = []
+        self.begin_transaction()
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.cursor.executemany(UPSERT_QUERIES[category], batch)
+                    self.store_row_hashes(category, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                self.cursor.executemany(UPSERT_QUERIES[category], batch)
+                self.store_row_hashes(category, batch)
+                count += len(batch)
+            self.commit_transaction()
+        except Exception as e:
+            # Rollback the whole batch load so the table is never left half-written
+            print(f"An error occurred during bulk upsert: {e}")
+            self.rollback_transaction()
+            raise
+        return count
 
-############### helper ###############
-def retrieve_and_insert_data(data_fetcher, db, category):
-    if category == "BusStops":
-        bus_stop_data = data_fetcher.get_bus_stops()
-        for stop in bus_stop_data:
-            db.insert_bus_stop(stop['BusStopCode'], stop['RoadName'], stop['Description'], stop['Latitude'],
-                               stop['Longitude'])
-        print(f"Bus stops retrieved from the API and inserted into the database.")
+    def bulk_upsert_routes(self, routes, batch_size=500):
+        # Insert or update bus routes keyed by (ServiceNo, Direction, StopSequence)
+        return self.bulk_upsert("BusRoutes", routes, batch_size)
 
-    elif category == "BusServices":
-        bus_services_data = data_fetcher.get_bus_services()
-        for service in bus_services_data:
-            db.insert_bus_service(service['ServiceNo'], service['Operator'], service['Direction'], service['Category'],
-                                  service['OriginCode'], service['DestinationCode'], service['AM_Peak_Freq'],
-                                  service['AM_Offpeak_Freq'], service['PM_Peak_Freq'], service['PM_Offpeak_Freq'],
-                                  service['LoopDesc'])
-        print(f"Bus services retrieved from the API and inserted into the database.")
+    def bulk_upsert_services(self, services, batch_size=500):
+        # Insert or update bus services keyed by (ServiceNo, Direction)
+        return self.bulk_upsert("BusServices", services, batch_size)
 
-    elif category == "BusRoutes":
-        bus_routes_data = data_fetcher.get_bus_routes()
-        for route in bus_routes_data:
-            db.insert_bus_route(route['ServiceNo'], route['Operator'], route['Direction'],
-                                route['StopSequence'], route['BusStopCode'], route['Distance'],
-                                route['WD_FirstBus'], route['WD_LastBus'], route['SAT_FirstBus'],
-                                route['SAT_LastBus'], route['SUN_FirstBus'], route['SUN_LastBus'])
-        print(f"Bus routes retrieved from the API and inserted into the database.")
-
-
-def retrieve_data_from_database(db, category, treeview):
-    # Clear the existing TreeView items
-    for item in treeview.get_children():
-        treeview.delete(item)
-
-    # Hard-coded column names for the TreeView widget
-    bus_routes_columns = [
-        "ServiceNo", "Operator", "Direction", "StopSequence", "BusStopCode", "Distance",
-        "WD_FirstBus", "WD_LastBus", "SAT_FirstBus", "SAT_LastBus", "SUN_FirstBus", "SUN_LastBus"
-    ]
+    def bulk_upsert_stops(self, stops, batch_size=500):
+        # Insert or update bus stops keyed by BusStopCode
+        return self.bulk_upsert("BusStops", stops, batch_size)
 
-    bus_services_columns = [
-        "ServiceNo", "Operator", "Direction", "Category", "OriginCode", "DestinationCode",
-        "AM_Peak_Freq", "AM_Offpeak_Freq", "PM_Peak_Freq", "PM_Offpeak_Freq", "LoopDesc"
-    ]
+    def incremental_sync(self, category, rows, batch_size=500):
+        # Compare each row's content hash with the one stored at the last sync and only
+        # write rows that were inserted or changed, deleting rows that disappeared upstream.
+        # Rows are written batch by batch as they arrive; only the keys seen so far are kept
+        self.cursor.execute("SELECT RowKey, RowHash FROM RowHashes WHERE Category = ?", (category,))
+        stored = dict(self.cursor.fetchall())
 
-    bus_stops_columns = [
-        "BusStopCode", "RoadName", "Description", "Latitude", "Longitude"
-    ]
+        counts = {"inserted": 0, "changed": 0, "removed": 0, "unchanged": 0}
+        seen = set()
+        batch = []
 
-    columns = {
-        "BusStops": bus_stops_columns,
-        "BusServices": bus_services_columns,
-        "BusRoutes": bus_routes_columns,
-    }
+        def flush():
+            self.cursor.executemany(UPSERT_QUERIES[category], batch)
+            self.store_row_hashes(category, batch)
+            batch.clear()
 
-    selected_columns = columns.get(category, [])
+        self.begin_transaction()
+        try:
+            for row in rows:
+                key = row_key(category, row)
+                current = row_hash(row)
+                previous = stored.get(key)
+                if key not in seen:
+                    seen.add(key)
+                    counts["inserted" if previous is None else "changed" if previous != current else "unchanged"] += 1
+                if previous == current:
+                    continue
+                # A key repeated within one sync is written again if it differs; the last row wins,
+                # as it would in a full upsert refresh
+                stored[key] = current
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+
+            # Keys stored before but not returned by the API this time
+            removed_keys = [key for key in stored if key not in seen]
+            if not seen and removed_keys:
+                # Never wipe a table because the API handed back an empty dataset
+                print(f"No {category} rows received; skipping removal of {len(removed_keys)} rows.")
+                removed_keys = []
+            counts["removed"] = len(removed_keys)
+            self.cursor.executemany(DELETE_QUERIES[category], [json.loads(key) for key in removed_keys])
+            self.cursor.executemany("DELETE FROM RowHashes WHERE Category = ? AND RowKey = ?",
+                                    [(category, key) for key in removed_keys])
+            self.commit_transaction()
+        except Exception as e:
+            print(f"An error occurred during incremental sync of {category}: {e}")
+            self.rollback_transaction()
+            raise
+        return counts
 
-    # Create a mapping of column names to integer indices
-    column_mapping = {col: i for i, col in enumerate(selected_columns)}
 
-    # Configure the TreeView headings based on the selected category
-    for col in selected_columns:
-        try:
-            treeview.heading(column_mapping[col], text=col)
-            treeview.column(column_mapping[col], width=100)
-        except tk.TclError as e:
-            print(f"Error configuring heading for column {col}: {e}")
+############### helper ###############
+def row_key(category, row):
+    # Natural key of a row as stored in RowHashes
+    return json.dumps([row[i] for i in ROW_KEY_INDICES[category]])
 
-    # Retrieve data from the database based on the selected category
-    query = f"SELECT * FROM {category.capitalize()}"
-    db.cursor.execute(query)
-    data = db.cursor.fetchall()
 
-    # Display the data in the TreeView
-    for row in data:
-        treeview.insert("", "end", values=row)
+def row_hash(row):
+    return hashlib.sha1(json.dumps(row).encode()).hexdigest()
 
 
-def sort_treeview_column(treeview, col, reverse=False):
-    # Retrieve the data from the TreeView
-    data = [(treeview.set(child, col), child) for child in treeview.get_children('')]
+def bus_stop_row(stop):
+    return (stop['BusStopCode'], stop['RoadName'], stop['Description'], stop['Latitude'], stop['Longitude'])
 
-    # Sort the data in-place
-    data.sort(reverse=reverse)
 
-    # Rearrange items in the TreeView based on the sorted data
-    for index, (value, child) in enumerate(data):
-        treeview.move(child, '', index)
+def bus_service_row(service):
+    return (service['ServiceNo'], service['Operator'], service['Direction'], service['Category'],
+            service['OriginCode'], service['DestinationCode'], service['AM_Peak_Freq'],
+            service['AM_Offpeak_Freq'], service['PM_Peak_Freq'], service['PM_Offpeak_Freq'],
+            service['LoopDesc'])
 
 
-def sort_column_wrapper(treeview, col):
-    # Get the current sorting order for the specified column
-    current_order = column_sort_orders.get(col, None)
+def bus_route_row(route):
+    return (route['ServiceNo'], route['Operator'], route['Direction'],
+            route['StopSequence'], route['BusStopCode'], route['Distance'],
+            route['WD_FirstBus'], route['WD_LastBus'], route['SAT_FirstBus'],
+            route['SAT_LastBus'], route['SUN_FirstBus'], route['SUN_LastBus'])
 
-    if current_order is None or current_order == 'asc':
-        # If current order is not set or ascending, toggle to descending
-        reverse = True
-        column_sort_orders[col] = 'desc'
-    else:
-        # If current order is descending, toggle to ascending
-        reverse = False
-        column_sort_orders[col] = 'asc'
 
-    # Update the heading command to the new sorting order for the specified column
-    treeview.heading(col, command=lambda c=col: sort_column_wrapper(treeview, c))
+def stream_pages(pages, max_pages=4):
+    # Run the page iterator on a producer thread and hand pages over through a bounded
+    # queue, so fetching overlaps with writing and at most max_pages are held in memory
+    page_queue = queue.Queue(maxsize=max_pages)
+    stop = threading.Event()
+    done = object()
 
-    # Sort the TreeView column for the specified column
-    sort_treeview_column(treeview, col, reverse)
+    def put(item):
+        while not stop.is_set():
+            try:
+                page_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
 
+    def produce():
+        try:
+            for page in pages:
+                if not put(page):
+                    break
+            put(done)
+        except Exception as e:
+            put(e)
+        finally:
+            pages.close()
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = page_queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        # Unblock the producer if the consumer stopped early
+        stop.set()
+        producer.join()
+
+
+def retrieve_and_insert_data(data_fetcher, db, category, incremental=False, progress=None):
+    if category == "BusStops":
+        row, upsert, label = bus_stop_row, db.bulk_upsert_stops, "Bus stops"
+    elif category == "BusServices":
+        row, upsert, label = bus_service_row, db.bulk_upsert_services, "Bus services"
+    elif category == "BusRoutes":
+        row, upsert, label = bus_route_row, db.bulk_upsert_routes, "Bus routes"
+    else:
+        return {"rows": 0}
+
+    # The previous size of the table is the best estimate of how many rows are coming
+    expected = db.conn.execute(f"SELECT COUNT(*) FROM {category}").fetchone()[0] if progress else 0
+    start = time.perf_counter()
+
+    def tracked_rows(pages):
+        pages_done = 0
+        rows_done = 0
+        for page in pages:
+            for record in page:
+                yield row(record)
+            pages_done += 1
+            rows_done += len(page)
+            if progress:
+                elapsed = time.perf_counter() - start
+                rate = rows_done / elapsed if elapsed > 0 else 0
+                eta = (expected - rows_done) / rate if rate and expected > rows_done else None
+                progress(pages=pages_done, rows=rows_done, eta=eta)
+
+    previous_profile = db.use_profile("bulk_load")
+    try:
+        pages = stream_pages(data_fetcher.iter_pages(category))
+        rows = tracked_rows(pages)
+        if incremental:
+            # Only rows that were inserted, changed or removed since the last sync are written
+            result = db.incremental_sync(category, rows)
+            result["rows"] = result["inserted"] + result["changed"] + result["unchanged"]
+        else:
+            # Pages are written as soon as they arrive while later pages are still being fetched
+            result = {"rows": upsert(rows)}
+    finally:
+        db.use_profile(previous_profile)
+
+    # Report the end-to-end throughput of the fetch and database write
+    elapsed = time.perf_counter() - start
+    rate = result["rows"] / elapsed if elapsed > 0 else float(result["rows"])
+    print(f"{label} retrieved from the API and inserted into the database: "
+          f"{result['rows']} rows in {elapsed:.2f}s ({rate:.0f} rows/sec).")
+    if incremental:
+        print(f"{label} inserted: {result['inserted']}, changed: {result['changed']}, "
+              f"removed: {result['removed']}, unchanged: {result['unchanged']}")
+    return result
+
+
+def describe_result(result):
+    # Short summary of a retrieve_and_insert_data result for display in the GUI
+    return ", ".join(f"{name} {count}" for name, count in result.items())
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask:
+    # Runs a job off the Tk main loop on a worker thread with its own database connection.
+    # The job receives (db, task) and may call task.report(...) to post progress; messages are
+    # handed back to the UI thread through a queue that is drained with after() polling.
+    def __init__(self, root, db_file, job, on_progress=None, on_done=None, poll_ms=100):
+        self.root = root
+        self.db_file = db_file
+        self.job = job
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.poll_ms = poll_ms
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.root.after(self.poll_ms, self.poll)
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self):
+        return self.thread.is_alive()
+
+    def report(self, **progress):
+        # Called on the worker thread; a pending cancellation surfaces here and unwinds the job
+        if self.cancel_event.is_set():
+            raise TaskCancelled("Task cancelled")
+        self.messages.put(("progress", progress))
+
+    def run(self):
+        # SQLite connections belong to the thread that opened them, so the worker opens its own.
+        # Opening it is inside the try so a failure still reaches the UI instead of killing the thread
+        db = None
+        try:
+            db = PublicTransportDatabase(self.db_file)
+            self.messages.put(("done", self.job(db, self)))
+        except TaskCancelled:
+            self.messages.put(("cancelled", None))
+        except Exception as e:
+            self.messages.put(("error", e))
+        finally:
+            if db is not None:
+                db.close()
+
+    def poll(self):
+        # Runs on the UI thread: apply every queued message, then check again later
+        while True:
+            try:
+                kind, payload = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == "progress":
+                if self.on_progress:
+                    self.on_progress(payload)
+            else:
+                if self.on_done:
+                    self.on_done(kind, payload)
+                return
+        self.root.after(self.poll_ms, self.poll)
 
-# Dictionary to store the sorting order for each column
-column_sort_orders = {}
 
+def describe_progress(progress):
+    text = f"{progress['pages']} pages fetched, {progress['rows']} rows written"
+    if progress["eta"] is not None:
+        text += f", ETA {progress['eta']:.0f}s"
+    return text
 
-def filter_treeview_data(treeview, category, filter_column, filter_value):
-    # Clear the existing TreeView items
-    for item in treeview.get_children():
-        treeview.delete(item)
 
-    # Hard-coded column names for the TreeView widget
-    bus_routes_columns = [
+# Column names displayed for each table, in TreeView order
+TABLE_COLUMNS = {
+    "BusRoutes": [
         "ServiceNo", "Operator", "Direction", "StopSequence", "BusStopCode", "Distance",
         "WD_FirstBus", "WD_LastBus", "SAT_FirstBus", "SAT_LastBus", "SUN_FirstBus", "SUN_LastBus"
-    ]
-
-    bus_services_columns = [
+    ],
+    "BusServices": [
         "ServiceNo", "Operator", "Direction", "Category", "OriginCode", "DestinationCode",
         "AM_Peak_Freq", "AM_Offpeak_Freq", "PM_Peak_Freq", "PM_Offpeak_Freq", "LoopDesc"
-    ]
-
-    bus_stops_columns = [
+    ],
+    "BusStops": [
         "BusStopCode", "RoadName", "Description", "Latitude", "Longitude"
-    ]
-
-    columns = {
-        "BuStops": bus_stops_columns,
-        "BusServices": bus_services_columns,
-        "BusRoutes": bus_routes_columns,
-    }
+    ],
+}
+
+# Unique, indexed column used as the keyset pagination key for each table
+TABLE_KEYS = {
+    "BusRoutes": "RouteID",
+    "BusServices": "rowid",  # ServiceNo repeats once per direction
+    "BusStops": "BusStopCode",
+}
+
+
+# Sort expressions for columns whose stored type does not sort naturally on its own.
+# Service numbers such as "10", "10e" and "2N" are text, so sort by their numeric part first.
+SORT_EXPRESSIONS = {
+    "ServiceNo": ["CAST(ServiceNo AS INTEGER)", "ServiceNo"],
+}
+
+
+class TablePager:
+    # Keyset pagination over one table: rows are ordered by the sort column (if any) followed by
+    # the table's unique key, and each page is fetched as "the next LIMIT rows after this row",
+    # so loading any page is a single indexed query regardless of table size
+    def __init__(self, db, category, filter_column=None, filter_value=None, sort_column=None, descending=False):
+        self.db = db
+        self.category = category
+        self.columns = TABLE_COLUMNS[category]
+        self.key = TABLE_KEYS[category]
+        self.filter_column = filter_column
+        self.filter_value = filter_value
+        self.sort_column = sort_column
+        self.descending = descending
+
+        self.conditions = []
+        self.params = []
+        if filter_column is not None:
+            if filter_column not in self.columns:
+                raise ValueError(f"Unknown column {filter_column} for {category}")
+            self.conditions.append(f"{filter_column} = ?")
+            self.params.append(filter_value)
+
+        sort_expressions = []
+        if sort_column is not None:
+            if sort_column not in self.columns:
+                raise ValueError(f"Unknown column {sort_column} for {category}")
+            sort_expressions = SORT_EXPRESSIONS.get(sort_column, [sort_column])
+
+        # Each row holds its ordering values first, followed by the displayed columns
+        self.order_expressions = sort_expressions + [self.key]
+        self.select = f"SELECT {', '.join(self.order_expressions + self.columns)} FROM {category}"
+
+    def sorted(self, sort_column, descending=False):
+        # Same table and filter, different ordering
+        return TablePager(self.db, self.category, self.filter_column, self.filter_value, sort_column, descending)
+
+    def values(self, row):
+        # The displayed column values of a row
+        return row[len(self.order_expressions):]
+
+    def after(self, row, descending):
+        # Condition matching the rows strictly after row in the given direction. SQLite sorts
+        # NULL first, so "after NULL" ascending means any non-NULL value, and descending
+        # "after v" includes the NULLs that come last.
+        anchor = row[:len(self.order_expressions)]
+        alternatives = []
+        params = []
+        for index, expression in enumerate(self.order_expressions):
+            parts = [f"{previous} IS ?" for previous in self.order_expressions[:index]]
+            part_params = list(anchor[:index])
+            value = anchor[index]
+            if not descending:
+                if value is None:
+                    parts.append(f"{expression} IS NOT NULL")
+                else:
+                    parts.append(f"{expression} > ?")
+                    part_params.append(value)
+            else:
+                if value is None:
+                    continue  # Nothing sorts after NULL in descending order
+                parts.append(f"({expression} < ? OR {expression} IS NULL)")
+                part_params.append(value)
+            alternatives.append(" AND ".join(parts))
+            params.extend(part_params)
+
+        if not alternatives:
+            return "0", []
+        condition = " OR ".join(f"({alternative})" for alternative in alternatives)
+
+        # Let SQLite seek straight to the anchor on the leading sort expression
+        if not descending and anchor[0] is not None:
+            condition = f"{self.order_expressions[0]} >= ? AND ({condition})"
+            params.insert(0, anchor[0])
+        return condition, params
+
+    def query(self, extra_condition, extra_params, descending, limit, offset=0):
+        conditions = self.conditions + ([extra_condition] if extra_condition else [])
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        direction = "DESC" if descending else "ASC"
+        order = ", ".join(f"{expression} {direction}" for expression in self.order_expressions)
+        sql = f"{self.select}{where} ORDER BY {order} LIMIT ? OFFSET ?"
+        return self.db.conn.execute(sql, self.params + list(extra_params) + [limit, offset]).fetchall()
+
+    def count(self):
+        where = f" WHERE {' AND '.join(self.conditions)}" if self.conditions else ""
+        return self.db.conn.execute(f"SELECT COUNT(*) FROM {self.category}{where}", self.params).fetchone()[0]
+
+    def page_at(self, offset, limit):
+        # Used for jumps to an arbitrary scrollbar position
+        return self.query(None, (), self.descending, limit, offset)
+
+    def page_after(self, row, limit):
+        condition, params = self.after(row, self.descending)
+        return self.query(condition, params, self.descending, limit)
+
+    def page_before(self, row, limit):
+        # The rows just before row, returned in display order
+        condition, params = self.after(row, not self.descending)
+        return self.query(condition, params, not self.descending, limit)[::-1]
+
+
+class VirtualTreeview:
+    # Treeview that only materializes the visible window of rows. Rows are fetched lazily
+    # from a TablePager as the user scrolls, so table size does not affect load time.
+    def __init__(self, parent, columns, visible_rows=20):
+        self.frame = tk.Frame(parent)
+        self.columns = columns
+        self.visible_rows = visible_rows
+        self.treeview = ttk.Treeview(self.frame, columns=columns, show="headings", height=visible_rows)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.on_scroll)
+        self.treeview.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        # Mouse wheel on Windows/macOS and X11 respectively
+        self.treeview.bind("<MouseWheel>", lambda event: self.scroll_rows(-3 if event.delta > 0 else 3))
+        self.treeview.bind("<Button-4>", lambda event: self.scroll_rows(-3))
+        self.treeview.bind("<Button-5>", lambda event: self.scroll_rows(3))
+
+        self.pager = None
+        self.total = 0
+        self.offset = 0
+        self.window = []  # Visible rows, each starting with its ordering values
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def load(self, pager):
+        self.pager = pager
+        self.total = pager.count()
+        self.offset = 0
+        self.window = pager.page_at(0, self.visible_rows)
+
+        # Label the generic columns with the table's column names; clicking a heading sorts by it
+        for index, col in enumerate(self.columns):
+            if index < len(pager.columns):
+                name = pager.columns[index]
+                marker = (" (desc)" if pager.descending else " (asc)") if name == pager.sort_column else ""
+                self.treeview.heading(col, text=name + marker, command=lambda n=name: sort_column_wrapper(self, n))
+            else:
+                self.treeview.heading(col, text="", command="")
+        self.render()
+
+    def sort(self, column, descending=False):
+        # Re-query the same rows ordered by column in SQLite and show the first page
+        if self.pager is not None:
+            self.load(self.pager.sorted(column, descending))
+
+    def scroll_rows(self, count):
+        if self.pager is None or not self.window:
+            return
+        target = max(0, min(self.offset + count, self.total - self.visible_rows))
+        step = target - self.offset
+        if step == 0:
+            return
+
+        if abs(step) >= len(self.window):
+            # Nothing on screen survives the move, so jump straight to the new offset
+            self.window = self.pager.page_at(target, self.visible_rows)
+        elif step > 0:
+            # Keep the rows still visible and fetch only the new ones after the last key
+            self.window = self.window[step:] + self.pager.page_after(self.window[-1], step)
+        else:
+            self.window = (self.pager.page_before(self.window[0], -step) + self.window)[:self.visible_rows]
+        self.offset = target
+        self.render()
+
+    def on_scroll(self, action, value, unit=None):
+        if action == "moveto":
+            target = int(float(value) * self.total)
+            self.scroll_rows(target - self.offset)
+        elif action == "scroll":
+            step = int(value) * (self.visible_rows if unit == "pages" else 1)
+            self.scroll_rows(step)
+
+    def render(self):
+        self.treeview.delete(*self.treeview.get_children())
+        for row in self.window:
+            self.treeview.insert("", "end", values=self.pager.values(row))
+
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, (self.offset + len(self.window)) / self.total)
+        else:
+            self.scrollbar.set(0, 1)
+
+
+def retrieve_data_from_database(db, category, grid):
+    # Show the table in the grid; only the first visible page is read from the database
+    grid.load(TablePager(db, category))
+
+
+def sort_treeview_column(grid, col, reverse=False):
+    # Sorting runs as an ORDER BY in SQLite; the grid then shows the first page of the result
+    grid.sort(col, reverse)
+
+
+def sort_column_wrapper(grid, col):
+    # Get the current sorting order for the specified column
+    current_order = column_sort_orders.get(col, None)
 
-    selected_columns = columns.get(category, [])
+    if current_order is None or current_order == 'asc':
+        # If current order is not set or ascending, toggle to descending
+        reverse = True
+        column_sort_orders[col] = 'desc'
+    else:
+        # If current order is descending, toggle to ascending
+        reverse = False
+        column_sort_orders[col] = 'asc'
 
-    # Create a mapping of column names to integer indices
-    column_mapping = {col: i for i, col in enumerate(selected_columns)}
+    # Sort the grid by the specified column
+    sort_treeview_column(grid, col, reverse)
 
-    # Configure the TreeView headings based on the selected category
-    for col in selected_columns:
-        try:
-            treeview.heading(column_mapping[col], text=col)
-            treeview.column(column_mapping[col], width=100)
-        except tk.TclError as e:
-            print(f"Error configuring heading for column {col}: {e}")
 
-    # Construct SQL query for filtering based on the specified column and value
-    query = f"SELECT * FROM {category.capitalize()} WHERE {filter_column} = ?"
+# Dictionary to store the sorting order for each column
+column_sort_orders = {}
 
-    # Execute the SQL query with the filter value
-    db.cursor.execute(query, (filter_value,))
-    data = db.cursor.fetchall()
 
-    # Display the filtered data in the TreeView
-    for row in data:
-        treeview.insert("", "end", values=row)
+def filter_treeview_data(grid, category, filter_column, filter_value):
+    # Show only the rows matching the filter, paged the same way as the full table
+    grid.load(TablePager(db, category, filter_column, filter_value))
 
 
+# db may be a PublicTransportDatabase or a read-only NetworkSnapshot (snapshot.py)
 def select_specific_bus_stop(db, bus_stop_code):
-    db.cursor.execute("SELECT * FROM BusStops WHERE BusStopCode = ?", (bus_stop_code,))
-    bus_stop = db.cursor.fetchone()
+    bus_stop = db.get_bus_stop(bus_stop_code)
     if bus_stop:
         result = f"Bus Stop Details:\n"
         result += f"Bus Stop Code: {bus_stop[0]}\n"
@@ -442,9 +1074,8 @@ def select_specific_bus_stop(db, bus_stop_code):
 
 
 def select_bus_service(db, service_no):
-    # Query the database for the specific bus service
-    db.cursor.execute("SELECT * FROM BusServices WHERE ServiceNo = ?", (service_no,))
-    service = db.cursor.fetchone()
+    # Query the database (or snapshot) for the specific bus service
+    service = db.get_bus_service(service_no)
     if service:
         result = f"Bus Service Details:\n"
         result += f"Service Number: {service[0]}\n"
@@ -587,9 +1218,40 @@ def main_menu():
         api_window.title("API Operations")
         center_window(api_window, 400, 300)  # Center the API window
 
+        # Only one ingestion runs at a time; it is kept here so it can be cancelled
+        running = {}
+
         def retrieve_data(category):
-            result = retrieve_and_insert_data(data_fetcher, db, category)
-            result_label.config(text=f"Data retrieved and inserted for {category}")
+            task = running.get("task")
+            if task is not None and task.is_running():
+                messagebox.showinfo("API Operations", "A retrieval is already running.")
+                return
+
+            incremental = incremental_var.get()
+
+            def job(task_db, task):
+                return retrieve_and_insert_data(data_fetcher, task_db, category, incremental, progress=task.report)
+
+            def on_progress(progress):
+                result_label.config(text=f"Retrieving {category}: {describe_progress(progress)}")
+
+            def on_done(kind, payload):
+                if kind == "done":
+                    result_label.config(text=f"Data retrieved and inserted for {category} ({describe_result(payload)})")
+                elif kind == "cancelled":
+                    result_label.config(text=f"Retrieval of {category} cancelled")
+                else:
+                    print(f"An error occurred while fetching {category}: {payload}")
+                    result_label.config(text=f"Failed to retrieve {category}: {payload}")
+
+            result_label.config(text=f"Retrieving {category}...")
+            running["task"] = BackgroundTask(main_window, db.db_file, job, on_progress, on_done)
+            running["task"].start()
+
+        def cancel_retrieval():
+            task = running.get("task")
+            if task is not None and task.is_running():
+                task.cancel()
 
         options = {
             "BusStops": "BusStops",
@@ -600,29 +1262,45 @@ def main_menu():
         option_label = tk.Label(api_window, text="Select a category:")
         option_label.pack()
 
+        # Incremental refresh only writes rows that changed since the last sync
+        incremental_var = tk.BooleanVar(value=True)
+        incremental_check = tk.Checkbutton(api_window, text="Incremental refresh", variable=incremental_var)
+        incremental_check.pack()
+
         for category, label in options.items():
             category_button = tk.Button(api_window, text=label, command=lambda cat=category: retrieve_data(cat))
             category_button.pack()
 
+        cancel_button = tk.Button(api_window, text="Cancel", command=cancel_retrieval)
+        cancel_button.pack()
+
     def database_operations():
         db_window = tk.Toplevel(main_window)
         db_window.title("Database Operations")
         center_window(db_window, 1200, 500)  # Center the DB window
 
-        # Create a TreeView widget to display the results
+        # Create a virtualized TreeView widget to display the results
         columns = ("Column_1", "Column_2", "Column_3", "Column_4",
                    "Column_5", "Column_6", "Column_7", "Column_8",
                    "Column_9", "Column_10", "Column_11", "Column_12")
-        treeview = ttk.Treeview(db_window, columns=columns, show="headings")
+        grid = VirtualTreeview(db_window, columns)
+        treeview = grid.treeview
         for col in columns:
             treeview.heading(col, text=col)
             treeview.column(col, width=100)
 
-        treeview.pack()
+        grid.pack()
+
+        # Category currently shown in the grid
+        selected_category = tk.StringVar(value="")
 
         def retrieve_data(category):
             # Retrieve and display the data using the TreeView widget
-            retrieve_data_from_database(db, category, treeview)
+            selected_category.set(category)
+            retrieve_data_from_database(db, category, grid)
+            # The previous table's column may not exist in this one
+            filter_column_box.configure(values=TABLE_COLUMNS[category])
+            filter_column_box.set("")
 
         options = {
             "BusStops": "BusStops",
@@ -638,40 +1316,39 @@ def main_menu():
             category_button.pack()
 
         # Sorting Widgets
-        def sort_treeview_column(col):
-            # Toggle between ascending and descending order
-            current_order = treeview.heading(col)['command']
-            reverse = not current_order
-
-            # Update the heading command to the new sorting order
-            treeview.heading(col, command=lambda: sort_treeview_column(col))
-
-            # Retrieve the data from the TreeView
-            data = [(treeview.set(child, col), child) for child in treeview.get_children('')]
-
-            # Sort the data in-place
-            data.sort(reverse=reverse)
-
-            # Rearrange items in the TreeView based on the sorted data
-            for index, (value, child) in enumerate(data):
-                treeview.move(child, '', index)
+        def sort_by_position(col):
+            # Sort buttons refer to generic column positions; map them to the table's column name
+            category = selected_category.get()
+            index = columns.index(col)
+            if category and index < len(TABLE_COLUMNS[category]):
+                sort_column_wrapper(grid, TABLE_COLUMNS[category][index])
 
         sort_label = tk.Label(db_window, text="Sort by column:")
         sort_label.pack(side=tk.LEFT)
 
         for col in columns:
-            sort_button = tk.Button(db_window, text=col, command=lambda c=col: sort_treeview_column(c))
+            sort_button = tk.Button(db_window, text=col, command=lambda c=col: sort_by_position(c))
             sort_button.pack(side=tk.LEFT)
 
         # Filtering Widgets
         def filter_data():
             keyword = filter_entry.get()
+            category = selected_category.get()
+            if not category or not filter_column_box.get():
+                messagebox.showinfo("Filter", "Select a category and a column to filter on.")
+                return
             # Call the backend function with the filter keyword
-            filter_treeview_data(treeview, category, keyword)
+            try:
+                filter_treeview_data(grid, category, filter_column_box.get(), keyword)
+            except ValueError as e:
+                messagebox.showerror("Filter", str(e))
 
         filter_label = tk.Label(db_window, text="Filter by keyword:")
         filter_label.pack(side=tk.RIGHT)
 
+        filter_column_box = ttk.Combobox(db_window, state="readonly", width=15)
+        filter_column_box.pack(side=tk.RIGHT)
+
         filter_entry = tk.Entry(db_window)
         filter_entry.pack(side=tk.RIGHT)
 